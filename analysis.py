@@ -0,0 +1,164 @@
+import logging
+import hashlib
+import json
+from flask import current_app
+from models import db, PRIORITY_PAID, PRIORITY_PREVIEW
+from cache import get_cache
+from payload_store import store_payload
+from ollama_client import OllamaClient, OllamaError
+from ingestion import get_board_state
+from sportsbook import SportsbookClient, SportsbookAPIError
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisError(Exception):
+    """Raised when a step of the analysis pipeline fails"""
+
+
+class AnalysisRunner:
+    """Runs a BetAnalysis through the sportsbook fetch and Ollama steps"""
+    
+    def __init__(self):
+        self.config = current_app.config
+    
+    def run(self, analysis):
+        """
+        Populate the payload, recommendations and ollama_analysis of an analysis
+        
+        Recommendations are committed before generation starts and the Ollama
+        text is committed as it streams, so pollers see useful output early.
+        """
+        payload = self.fetch_advantages()
+        board = get_board_state()
+        board.refresh(payload)
+        recommendations = self.build_recommendations(analysis, board)
+        
+        analysis.api_response_ref = store_payload(payload)
+        analysis.recommendations = recommendations
+        db.session.commit()
+        
+        def flush(text):
+            analysis.ollama_analysis = text
+            db.session.commit()
+        
+        # Identical legs against identical odds reuse a previous generation,
+        # or wait for one already in progress however long it runs
+        prompt = self.build_prompt(analysis, recommendations)
+        analysis.ollama_analysis = get_cache('ollama').get_or_set(
+            prompt_cache_key(analysis, recommendations, self.config['OLLAMA_MODEL']),
+            lambda: self.generate_analysis(
+                prompt,
+                on_partial=flush,
+                # Shared snapshots have no priority of their own and serve everyone
+                priority=getattr(analysis, 'priority', PRIORITY_PAID)
+            ),
+            self.config['OLLAMA_CACHE_TTL']
+        )
+        return analysis
+    
+    def fetch_advantages(self):
+        """Fetch the current advantages board from the Sportsbook API"""
+        try:
+            return SportsbookClient().get_cached_advantages()
+        except SportsbookAPIError as e:
+            raise AnalysisError(str(e)) from e
+    
+    def generate_analysis(self, prompt, on_partial=None, priority=PRIORITY_PREVIEW):
+        """Run a prompt through Ollama and return the generated text"""
+        try:
+            return OllamaClient().generate(prompt, on_partial=on_partial, priority=priority)
+        except OllamaError as e:
+            raise AnalysisError(str(e)) from e
+    
+    def build_recommendations(self, analysis, board):
+        """Arbitrage opportunities followed by value bets relevant to an analysis"""
+        limit = self.config['MAX_RECOMMENDATIONS']
+        return (
+            self.select_relevant(analysis, board.arbitrage())[:limit] +
+            self.select_relevant(analysis, board.value_bets())[:limit]
+        )
+    
+    def select_relevant(self, analysis, recommendations):
+        """Keep only recommendations for the game a specific-bet analysis is about"""
+        if analysis.analysis_type == 'specific_bet' and analysis.game:
+            game = analysis.game.lower()
+            return [
+                recommendation for recommendation in recommendations
+                if game in recommendation['market'].lower()
+            ]
+        return recommendations
+    
+    def build_prompt(self, analysis, recommendations):
+        """Build the Ollama prompt for an analysis"""
+        lines = [
+            'You are a sports betting analyst. Review the value bets below and '
+            'explain which offer the best value, how confident you are, and the main risks.',
+            ''
+        ]
+        
+        if analysis.analysis_type == 'specific_bet':
+            lines.append(f'Sport: {analysis.sport}')
+            lines.append(f'Game: {analysis.game}')
+            lines.append('Bet legs:')
+            for leg in analysis.bet_legs or []:
+                lines.append(f'- {leg}')
+            lines.append('')
+        
+        lines.append('Arbitrage opportunities:')
+        for recommendation in recommendations:
+            if recommendation['type'] != 'arbitrage':
+                continue
+            legs = ', '.join(
+                f"{leg['outcome']} @ {leg['decimal_odds']} ({leg['book']}, {leg['stake_percent']}% stake)"
+                for leg in recommendation['legs']
+            )
+            lines.append(
+                f"- {recommendation['market']}: {recommendation['profit_percent']}% profit: {legs}"
+            )
+        lines.append('')
+        
+        lines.append('Value bets (fair probability is the vig-free consensus across books):')
+        for recommendation in recommendations:
+            if recommendation['type'] != 'value_bet':
+                continue
+            lines.append(
+                f"- {recommendation['market']}: {recommendation['outcome']} "
+                f"@ {recommendation['decimal_odds']} ({recommendation['book']}), "
+                f"fair probability {recommendation['fair_probability']:.1%}, "
+                f"EV {recommendation['expected_value']:+.1%}"
+            )
+        
+        return '\n'.join(lines)
+
+
+def normalize_text(value):
+    """Lower-case and collapse whitespace so trivially different inputs match"""
+    if value is None:
+        return None
+    return ' '.join(str(value).lower().split())
+
+
+def prompt_cache_key(analysis, recommendations, model):
+    """
+    Content address of an Ollama analysis
+    
+    Hashes the normalized sport, game and (order-independent) bet legs,
+    the odds the prompt was built from and the model name.
+    """
+    legs = sorted(
+        normalize_text(leg) if isinstance(leg, str) else json.dumps(leg, sort_keys=True)
+        for leg in getattr(analysis, 'bet_legs', None) or []
+    )
+    odds_version = hashlib.sha256(
+        json.dumps(recommendations, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    material = json.dumps({
+        'analysis_type': analysis.analysis_type,
+        'sport': normalize_text(getattr(analysis, 'sport', None)),
+        'game': normalize_text(getattr(analysis, 'game', None)),
+        'bet_legs': legs,
+        'odds_version': odds_version,
+        'model': model
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
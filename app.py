@@ -1,8 +1,16 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_migrate import Migrate
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only, undefer_group
 from config import config
-from models import db, User, BetAnalysis, AnalysisFeedback, StripeEvent
+from models import db, User, BetAnalysis, AnalysisFeedback, StripeEvent, violated_unique_columns
+from events import analysis_event_stream
+from pagination import keyset_paginate, InvalidCursor
+from user_cache import get_user
+from passwords import HashingBusy
+from ollama_client import priority_for_user
+from auth import record_analysis_usage, rate_limited_response, verify_webhook_signature, enqueue_webhook_event
 import logging
 from datetime import datetime, timedelta
 import os
@@ -18,7 +26,7 @@ def create_app(config_name=None):
     
     # Initialize extensions
     db.init_app(app)
-    migrate = Migrate(app, db)
+    migrate = Migrate(app, db, render_as_batch=True)  # batch mode lets SQLite alter tables
     
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -27,7 +35,7 @@ def create_app(config_name=None):
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(user_id)
+        return get_user(user_id)
     
     # Configure logging
     logging.basicConfig(
@@ -39,6 +47,13 @@ def create_app(config_name=None):
     with app.app_context():
         db.create_all()
     
+    def busy_response():
+        """503 for requests shed while the password hashing pool is saturated"""
+        response = jsonify({'error': 'Server busy, please try again shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    
     # ==================== Public Routes ====================
     
     @app.route('/')
@@ -72,12 +87,6 @@ def create_app(config_name=None):
             if password != confirm_password:
                 return jsonify({'error': 'Passwords do not match'}), 400
             
-            if User.query.filter_by(username=username).first():
-                return jsonify({'error': 'Username already exists'}), 409
-            
-            if User.query.filter_by(email=email).first():
-                return jsonify({'error': 'Email already registered'}), 409
-            
             # Create user
             try:
                 user = User(
@@ -96,6 +105,18 @@ def create_app(config_name=None):
                 logger.info(f'New user registered: {username}')
                 
                 return redirect(url_for('upgrade_subscription'))
+            except HashingBusy:
+                return busy_response()
+            except IntegrityError as e:
+                # The unique indexes decide; no pre-check SELECTs to race
+                db.session.rollback()
+                violated = violated_unique_columns(e, User.__table__)
+                if violated == ('email',):
+                    return jsonify({'error': 'Email already registered'}), 409
+                if violated == ('username',):
+                    return jsonify({'error': 'Username already exists'}), 409
+                logger.error(f'Registration error: {str(e)}')
+                return jsonify({'error': 'Registration failed'}), 500
             except Exception as e:
                 db.session.rollback()
                 logger.error(f'Registration error: {str(e)}')
@@ -117,7 +138,19 @@ def create_app(config_name=None):
             
             user = User.query.filter_by(username=username).first()
             
-            if user and user.check_password(password):
+            try:
+                authenticated = user is not None and user.check_password(password)
+            except HashingBusy:
+                return busy_response()
+            
+            if authenticated:
+                if user.password_needs_rehash():
+                    # Upgrade the stored hash to the configured algorithm/cost
+                    try:
+                        user.set_password(password)
+                        db.session.commit()
+                    except HashingBusy:
+                        pass  # keep the old hash; it still verifies
                 login_user(user)
                 logger.info(f'User logged in: {username}')
                 return redirect(url_for('dashboard'))
@@ -172,14 +205,19 @@ def create_app(config_name=None):
         if not current_user.has_analysis_access():
             return jsonify({'error': 'Unauthorized'}), 403
         
-        if current_user.can_use_preview():
-            current_user.free_preview_used += 1
+        usage = record_analysis_usage(current_user, 'all_bets')
+        if not usage.allowed:
+            return rate_limited_response(usage)
+        
+        if not current_user.has_active_subscription() and not current_user.consume_preview():
+            return jsonify({'error': 'Free preview already used'}), 403
         
         try:
             analysis = BetAnalysis(
                 user_id=current_user.id,
                 analysis_type='all_bets',
-                status='processing'
+                status='processing',
+                priority=priority_for_user(current_user)
             )
             db.session.add(analysis)
             db.session.commit()
@@ -201,6 +239,10 @@ def create_app(config_name=None):
         if not current_user.has_analysis_access():
             return jsonify({'error': 'Unauthorized'}), 403
         
+        usage = record_analysis_usage(current_user, 'specific_bet')
+        if not usage.allowed:
+            return rate_limited_response(usage)
+        
         data = request.get_json()
         sport = data.get('sport')
         game = data.get('game')
@@ -209,8 +251,8 @@ def create_app(config_name=None):
         if not sport or not game or not bet_legs:
             return jsonify({'error': 'Missing required fields'}), 400
         
-        if current_user.can_use_preview():
-            current_user.free_preview_used += 1
+        if not current_user.has_active_subscription() and not current_user.consume_preview():
+            return jsonify({'error': 'Free preview already used'}), 403
         
         try:
             analysis = BetAnalysis(
@@ -219,7 +261,8 @@ def create_app(config_name=None):
                 sport=sport,
                 game=game,
                 bet_legs=bet_legs,
-                status='processing'
+                status='processing',
+                priority=priority_for_user(current_user)
             )
             db.session.add(analysis)
             db.session.commit()
@@ -238,36 +281,80 @@ def create_app(config_name=None):
     @login_required
     def get_analysis(analysis_id):
         """Get analysis results"""
-        analysis = BetAnalysis.query.filter_by(
+        analysis = BetAnalysis.query.options(
+            undefer_group('results')
+        ).filter_by(
+            id=analysis_id,
+            user_id=current_user.id
+        ).first_or_404()
+        
+        return jsonify(analysis.to_dict())
+    
+    
+    @app.route('/api/analysis/<analysis_id>/status')
+    @login_required
+    def get_analysis_status(analysis_id):
+        """Lightweight status poll; answers 304 when If-None-Match is current"""
+        analysis = BetAnalysis.query.options(
+            load_only(BetAnalysis.id, BetAnalysis.status, BetAnalysis.completed_at)
+        ).filter_by(
             id=analysis_id,
             user_id=current_user.id
         ).first_or_404()
         
-        return jsonify({
+        response = jsonify({
             'id': analysis.id,
             'status': analysis.status,
-            'analysis_type': analysis.analysis_type,
-            'sport': analysis.sport,
-            'game': analysis.game,
-            'api_response': analysis.api_response,
-            'ollama_analysis': analysis.ollama_analysis,
-            'recommendations': analysis.recommendations,
-            'created_at': analysis.created_at.isoformat(),
             'completed_at': analysis.completed_at.isoformat() if analysis.completed_at else None
         })
+        response.set_etag(analysis.status_etag())
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    
+    
+    @app.route('/api/analysis/<analysis_id>/events')
+    @login_required
+    def analysis_events(analysis_id):
+        """Stream analysis status changes and the final result (Server-Sent Events)"""
+        user_id = current_user.id
+        BetAnalysis.query.with_entities(BetAnalysis.id).filter_by(
+            id=analysis_id,
+            user_id=user_id
+        ).first_or_404()
+        
+        def load_status():
+            status = db.session.query(BetAnalysis.status).filter_by(id=analysis_id).scalar()
+            db.session.close()  # don't hold a connection while the stream idles
+            return status
+        
+        def load_result():
+            result = BetAnalysis.query.options(
+                undefer_group('results')
+            ).get(analysis_id).to_dict()
+            db.session.close()
+            return result
+        
+        return Response(
+            stream_with_context(analysis_event_stream(analysis_id, load_status, load_result)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
     
     
     @app.route('/analysis-history')
     @login_required
     def analysis_history():
         """View all past analyses"""
-        page = request.args.get('page', 1, type=int)
-        analyses = BetAnalysis.query.filter_by(
-            user_id=current_user.id
-        ).order_by(BetAnalysis.created_at.desc()).paginate(
-            page=page,
-            per_page=app.config['ITEMS_PER_PAGE']
-        )
+        try:
+            analyses = keyset_paginate(
+                BetAnalysis.query.filter_by(user_id=current_user.id),
+                BetAnalysis,
+                cursor=request.args.get('cursor'),
+                per_page=app.config['ITEMS_PER_PAGE'],
+                with_count=app.config['HISTORY_COUNT_TOTAL']
+            )
+        except InvalidCursor:
+            return redirect(url_for('analysis_history'))
         
         return render_template(
             'analysis_history.html',
@@ -330,6 +417,20 @@ def create_app(config_name=None):
         return render_template('profile.html', user=current_user)
     
     
+    @app.route('/webhooks/stripe', methods=['POST'])
+    def stripe_webhook():
+        """Verify and queue a Stripe event; the analysis worker applies it"""
+        event = verify_webhook_signature(
+            request.get_data(),
+            request.headers.get('Stripe-Signature', '')
+        )
+        if event is None:
+            return jsonify({'error': 'Invalid signature'}), 400
+        
+        enqueue_webhook_event(event)
+        return jsonify({'received': True}), 200
+    
+    
     # ==================== Error Handlers ====================
     
     @app.errorhandler(404)
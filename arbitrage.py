@@ -0,0 +1,104 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BestPriceIndex:
+    """
+    Best available price per market outcome across books
+    
+    Each outcome keeps every book's quote plus the current best, so a price
+    update is O(1) unless it lowers the best quote (then O(books) for that
+    outcome only), and checking a market for arbitrage is O(outcomes).
+    A market is only checked once every one of its outcomes has a price.
+    """
+    
+    def __init__(self):
+        self._markets = {}
+        self._outcomes = {}
+        self._lock = threading.Lock()
+    
+    def update_market(self, market, quotes, outcomes=None):
+        """
+        Replace a market's quotes with (outcome, book, decimal_odds) tuples
+        
+        outcomes is every outcome the market offers (defaults to those
+        quoted); arbitrage needs a price for all of them.
+        """
+        with self._lock:
+            entries = {}
+            for outcome, book, price in quotes:
+                entry = entries.setdefault(outcome, {'prices': {}, 'best': None})
+                entry['prices'][book] = price
+                if entry['best'] is None or price > entry['best'][0]:
+                    entry['best'] = (price, book)
+            self._markets[market] = entries
+            self._outcomes[market] = frozenset(entries if outcomes is None else outcomes)
+    
+    def update_price(self, market, outcome, book, price):
+        """Update a single book's quote for an outcome"""
+        with self._lock:
+            entry = self._markets.setdefault(market, {}).setdefault(
+                outcome, {'prices': {}, 'best': None}
+            )
+            entry['prices'][book] = price
+            if entry['best'] is None or price > entry['best'][0]:
+                entry['best'] = (price, book)
+            elif entry['best'][1] == book:
+                entry['best'] = max((p, b) for b, p in entry['prices'].items())
+    
+    def remove_market(self, market):
+        with self._lock:
+            self._markets.pop(market, None)
+            self._outcomes.pop(market, None)
+    
+    def markets(self):
+        with self._lock:
+            return list(self._markets)
+    
+    def best_prices(self, market):
+        """Return {outcome: (decimal_odds, book)} for a market"""
+        with self._lock:
+            return {
+                outcome: entry['best']
+                for outcome, entry in self._markets.get(market, {}).items()
+            }
+    
+    def find_arbitrage(self, market, min_profit_percent=0.0):
+        """Return the arbitrage available on a market's best prices, or None"""
+        with self._lock:
+            outcomes = self._outcomes.get(market)
+        best = self.best_prices(market)
+        if len(best) < 2 or (outcomes is not None and set(best) != outcomes):
+            # Missing a side: the "arbitrage" would leave an outcome unhedged
+            return None
+        
+        inverse_sum = sum(1 / price for price, _ in best.values())
+        profit_percent = (1 / inverse_sum - 1) * 100
+        if profit_percent < min_profit_percent:
+            return None
+        
+        return {
+            'type': 'arbitrage',
+            'market': market,
+            'profit_percent': round(profit_percent, 3),
+            'legs': [
+                {
+                    'outcome': outcome,
+                    'book': book,
+                    'decimal_odds': price,
+                    'stake_percent': round((1 / price) / inverse_sum * 100, 2)
+                }
+                for outcome, (price, book) in sorted(best.items())
+            ]
+        }
+
+
+def scan_markets(index, markets, min_profit_percent, outcomes=None):
+    """Update the index with changed markets and return {market: arbitrage or None}"""
+    found = {}
+    for market, quotes in markets.items():
+        index.update_market(market, quotes, (outcomes or {}).get(market))
+        found[market] = index.find_arbitrage(market, min_profit_percent)
+    return found
@@ -1,13 +1,32 @@
 from functools import wraps
 from flask import current_app, request, jsonify
 from flask_login import current_user
-from models import db, User, StripeEvent
+from sqlalchemy import update, or_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from models import db, User, StripeEvent, SKIP_LOCKED_DIALECTS
+import user_cache  # registers the hooks that drop cached users on commit
+from ratelimit import get_rate_limiter, RateLimitResult
+from cache import LRUCache, MISSING
 import stripe
 from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
+# INSERT constructs that support ON CONFLICT DO NOTHING, by dialect
+ON_CONFLICT_INSERTS = {'postgresql': postgresql_insert, 'sqlite': sqlite_insert}
+
+# Stripe event ids this process has seen queued (committed, not necessarily
+# processed); only short-circuits obvious redeliveries, the unique
+# constraint stays authoritative
+_queued_events = LRUCache(maxsize=4096)
+
+# (kind, Stripe customer/subscription id) -> user id; these never change owner
+_user_references = LRUCache(maxsize=4096)
+NEVER = float('inf')
+
 
 def subscription_required(f):
     """Decorator to check if user has active subscription or preview access"""
@@ -43,6 +62,8 @@ class StripeManager:
     def __init__(self):
         self.stripe_key = current_app.config['STRIPE_SECRET_KEY']
         stripe.api_key = self.stripe_key
+        if current_app.config['STRIPE_API_BASE']:
+            stripe.api_base = current_app.config['STRIPE_API_BASE']
     
     def create_customer(self, user):
         """Create a Stripe customer for a user"""
@@ -103,69 +124,210 @@ class StripeManager:
         except stripe.error.StripeError as e:
             logger.error(f'Subscription cancellation error: {str(e)}')
             raise
+
+
+def event_data_dict(event):
+    """The event's data object as plain JSON-serializable data"""
+    event_data = event['data']['object']
+    if hasattr(event_data, 'to_dict'):
+        event_data = event_data.to_dict()
+    return event_data
+
+
+def claim_stripe_event(event_id, event_type, event_data):
+    """
+    Insert an unprocessed StripeEvent unless one with this id exists
+    
+    Returns True when this call inserted the row. Uses INSERT ... ON
+    CONFLICT DO NOTHING where supported (a savepoint elsewhere), so a
+    duplicate costs one statement and never raises. Runs in the caller's
+    transaction.
+    """
+    values = {
+        'stripe_event_id': event_id,
+        'event_type': event_type,
+        'event_data': event_data,
+        'processed': False
+    }
+    
+    dialect = db.engine.dialect.name
+    if dialect in ON_CONFLICT_INSERTS:
+        statement = ON_CONFLICT_INSERTS[dialect](StripeEvent).values(**values).on_conflict_do_nothing(
+            index_elements=['stripe_event_id']
+        )
+        return db.session.execute(statement).rowcount == 1
+    
+    try:
+        with db.session.begin_nested():
+            db.session.add(StripeEvent(**values))
+        return True
+    except IntegrityError:
+        return False
+
+
+def stripe_references(event_data):
+    """(user_id, customer_id, subscription_id) a Stripe object points at"""
+    def object_id(value):
+        return value.get('id') if isinstance(value, dict) else value
     
-    def handle_webhook(self, event):
-        """Handle incoming Stripe webhook events"""
+    subscription = event_data.get('subscription')
+    if subscription is None and event_data.get('object') == 'subscription':
+        subscription = event_data.get('id')
+    
+    metadata = event_data.get('metadata') or {}
+    return metadata.get('user_id'), object_id(event_data.get('customer')), object_id(subscription)
+
+
+def resolve_users(objects):
+    """
+    Users referenced by a list of Stripe objects (None where unknown)
+    
+    The Stripe customer id is preferred, then the subscription id, then
+    metadata.user_id (which many invoice events don't carry). Customer and
+    subscription ids are mapped to users through an LRU backed by indexed
+    IN queries, so a batch costs at most three queries however large it is.
+    """
+    references = [stripe_references(event_data) for event_data in objects]
+    found = {}
+    wanted = {'customer': set(), 'subscription': set()}
+    for _, customer_id, subscription_id in references:
+        for kind, value in (('customer', customer_id), ('subscription', subscription_id)):
+            if not value:
+                continue
+            user_id = _user_references.get((kind, value))
+            if user_id is MISSING:
+                wanted[kind].add(value)
+            else:
+                found[(kind, value)] = user_id
+    
+    for kind, column in (('customer', User.stripe_customer_id), ('subscription', User.stripe_subscription_id)):
+        if wanted[kind]:
+            for user_id, value in db.session.query(User.id, column).filter(column.in_(wanted[kind])):
+                found[(kind, value)] = user_id
+                _user_references.set((kind, value), user_id, NEVER)
+    
+    user_ids = [
+        found.get(('customer', customer_id)) or found.get(('subscription', subscription_id)) or metadata_user_id
+        for metadata_user_id, customer_id, subscription_id in references
+    ]
+    lookup = set(user_ids) - {None}
+    users = {user.id: user for user in User.query.filter(User.id.in_(lookup))} if lookup else {}
+    return [users.get(user_id) for user_id in user_ids]
+
+
+def subscription_period_end(subscription):
+    """current_period_end of a subscription (moved onto items in newer API versions)"""
+    period_end = subscription.get('current_period_end')
+    if period_end is None:
+        items = (subscription.get('items') or {}).get('data') or []
+        period_end = max((item.get('current_period_end') or 0 for item in items), default=None)
+    return datetime.utcfromtimestamp(period_end) if period_end else None
+
+
+def apply_webhook_event(event_type, event_data, user):
+    """Update a user's subscription from a Stripe event (caller commits)"""
+    if user is None:
+        return
+    
+    if event_type == 'customer.subscription.updated':
+        period_end = subscription_period_end(event_data)
+        if period_end is None:
+            raise ValueError(f"Subscription {event_data.get('id')} has no current_period_end")
+        user.subscription_status = 'active'
+        user.subscription_end_date = period_end
+    
+    elif event_type == 'customer.subscription.deleted':
+        user.subscription_status = 'cancelled'
+    
+    elif event_type == 'invoice.payment_succeeded':
+        user.subscription_status = 'active'
+
+
+def enqueue_webhook_event(event):
+    """
+    Durably queue a verified Stripe event for the background worker
+    
+    Only inserts the event row, so the webhook can answer Stripe right
+    away. Redeliveries are dropped by the queued-event LRU without touching
+    the database, or by the insert's conflict clause.
+    """
+    event_id = event['id']
+    if _queued_events.get(event_id) is not MISSING:
+        logger.info(f'Webhook event {event_id} already queued')
+        return
+    
+    queued = claim_stripe_event(event_id, event['type'], event_data_dict(event))
+    db.session.commit()
+    _queued_events.set(event_id, True, NEVER)
+    logger.info(f"Webhook event {event_id} {'queued' if queued else 'already queued'}")
+
+
+def process_webhook_events(batch_size=100):
+    """
+    Apply a batch of queued Stripe events in one transaction
+    
+    Events are taken oldest first (skipping rows locked by another worker
+    where the database supports it) and their users are resolved together
+    by resolve_users(). An event that fails is rolled back to its savepoint
+    and retried later with exponential backoff (STRIPE_WEBHOOK_RETRY_DELAY,
+    doubling per attempt) so it can't block the queue. After
+    STRIPE_WEBHOOK_MAX_ATTEMPTS failures it is parked with its error until
+    requeue_webhook_events() is run. Returns the number of events handled.
+    """
+    now = datetime.utcnow()
+    max_attempts = current_app.config['STRIPE_WEBHOOK_MAX_ATTEMPTS']
+    query = StripeEvent.query.filter(
+        StripeEvent.processed.is_(False),
+        StripeEvent.attempts < max_attempts,
+        or_(StripeEvent.next_attempt_at.is_(None), StripeEvent.next_attempt_at <= now)
+    ).order_by(StripeEvent.created_at).limit(batch_size)
+    if db.engine.dialect.name in SKIP_LOCKED_DIALECTS:
+        query = query.with_for_update(skip_locked=True)
+    events = query.all()
+    if not events:
+        return 0
+    
+    users = resolve_users([event.event_data for event in events])
+    
+    for event, user in zip(events, users):
         try:
-            event_type = event['type']
-            event_id = event['id']
-            event_data = event['data']['object']
-            
-            # Check if event already processed
-            existing_event = StripeEvent.query.filter_by(
-                stripe_event_id=event_id
-            ).first()
-            
-            if existing_event:
-                logger.info(f'Event {event_id} already processed')
-                return
-            
-            user = None
-            
-            if event_type == 'customer.subscription.updated':
-                user_id = event_data['metadata'].get('user_id')
-                if user_id:
-                    user = User.query.get(user_id)
-                    if user:
-                        user.subscription_status = 'active'
-                        user.subscription_end_date = datetime.utcfromtimestamp(
-                            event_data['current_period_end']
-                        )
-                        db.session.commit()
-            
-            elif event_type == 'customer.subscription.deleted':
-                user_id = event_data['metadata'].get('user_id')
-                if user_id:
-                    user = User.query.get(user_id)
-                    if user:
-                        user.subscription_status = 'cancelled'
-                        db.session.commit()
-            
-            elif event_type == 'invoice.payment_succeeded':
-                user_id = event_data['metadata'].get('user_id')
-                if user_id:
-                    user = User.query.get(user_id)
-                    if user:
-                        user.subscription_status = 'active'
-                        db.session.commit()
-            
-            # Record the event
-            stripe_event = StripeEvent(
-                stripe_event_id=event_id,
-                event_type=event_type,
-                user_id=user.id if user else None,
-                event_data=event_data,
-                processed=True
-            )
-            db.session.add(stripe_event)
-            db.session.commit()
-            
-            logger.info(f'Webhook event {event_id} processed successfully')
-            return True
-        
+            with db.session.begin_nested():
+                apply_webhook_event(event.event_type, event.event_data, user)
+                event.user_id = user.id if user else None
+                event.processed = True
         except Exception as e:
-            logger.error(f'Webhook processing error: {str(e)}')
-            raise
+            event.attempts += 1
+            event.error_message = str(e)
+            if event.attempts < max_attempts:
+                delay = current_app.config['STRIPE_WEBHOOK_RETRY_DELAY'] * 2 ** (event.attempts - 1)
+                event.next_attempt_at = now + timedelta(seconds=delay)
+                logger.warning(
+                    f'Webhook event {event.stripe_event_id} failed (attempt {event.attempts}), '
+                    f'retrying in {delay}s: {str(e)}'
+                )
+            else:
+                event.next_attempt_at = None
+                logger.error(f'Webhook event {event.stripe_event_id} parked after {event.attempts} attempts: {str(e)}')
+    
+    db.session.commit()
+    logger.info(f'Processed {len(events)} webhook events')
+    return len(events)
+
+
+def requeue_webhook_events(stripe_event_ids=None):
+    """Give parked (or the given) unprocessed events a fresh set of attempts; returns how many"""
+    query = update(StripeEvent).where(StripeEvent.processed.is_(False))
+    if stripe_event_ids:
+        query = query.where(StripeEvent.stripe_event_id.in_(stripe_event_ids))
+    else:
+        query = query.where(StripeEvent.attempts >= current_app.config['STRIPE_WEBHOOK_MAX_ATTEMPTS'])
+    
+    requeued = db.session.execute(
+        query.values(attempts=0, next_attempt_at=None, error_message=None)
+    ).rowcount
+    db.session.commit()
+    logger.info(f'Requeued {requeued} webhook events')
+    return requeued
 
 
 def verify_webhook_signature(request_data, signature):
@@ -187,6 +349,21 @@ def verify_webhook_signature(request_data, signature):
 
 
 def record_analysis_usage(user, analysis_type):
-    """Record analysis usage for rate limiting (future feature)"""
-    # This can be expanded for rate limiting per user tier
-    logger.info(f'User {user.username} used {analysis_type} analysis')
+    """Record an analysis request against the user's tier rate limits"""
+    if not current_app.config['RATELIMIT_ENABLED']:
+        return RateLimitResult(True)
+    
+    result = get_rate_limiter().hit(user.id, user.entitlement.tier)
+    if result.allowed:
+        logger.info(f'User {user.username} used {analysis_type} analysis')
+    else:
+        logger.warning(f'User {user.username} rate limited on {analysis_type} analysis')
+    return result
+
+
+def rate_limited_response(result):
+    """429 response telling the client when to retry"""
+    response = jsonify({'error': 'Rate limit exceeded', 'retry_after': result.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(result.retry_after)
+    return response
@@ -0,0 +1,106 @@
+import argparse
+import importlib.util
+import itertools
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import event
+from config import TestingConfig
+
+
+def create_app(database_url, hash_method):
+    """The web app on its own database (app.py is loaded by path: the app/ package shadows it)"""
+    TestingConfig.SQLALCHEMY_DATABASE_URI = database_url
+    TestingConfig.PASSWORD_HASH_METHOD = hash_method
+    spec = importlib.util.spec_from_file_location('wagerwise_app', os.path.join(ROOT, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.create_app('testing')
+
+
+def run(app, signups, threads, duplicate_every):
+    """Register `signups` users from `threads` clients; every Nth reuses an earlier username"""
+    from models import db
+    
+    statements = itertools.count()
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: next(statements))
+    
+    run_id = int(time.time())
+    numbers = iter(range(signups))
+    numbers_lock = threading.Lock()
+    results = []
+    
+    def client():
+        while True:
+            with numbers_lock:
+                n = next(numbers, None)
+            if n is None:
+                return
+            name = n - 1 if duplicate_every and n and n % duplicate_every == 0 else n
+            # A fresh client per signup: registering logs the client in
+            started = time.perf_counter()
+            response = app.test_client().post('/register', json={
+                'username': f'bench{run_id}_{name}',
+                'email': f'bench{run_id}_{n}@example.com',
+                'password': 'benchmark-password',
+                'confirm_password': 'benchmark-password'
+            })
+            results.append((response.status_code, time.perf_counter() - started))
+    
+    started = time.perf_counter()
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    
+    latencies = sorted(latency for _, latency in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        'signups': len(results),
+        'seconds': elapsed,
+        'per_second': len(results) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'statements_per_signup': next(statements) / len(results),
+        'statuses': statuses
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure /register throughput and database statements per signup')
+    parser.add_argument('--signups', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duplicate-every', type=int, default=10, help='every Nth signup reuses a username (0: never)')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--hash-method', default=TestingConfig.PASSWORD_HASH_METHOD,
+                        help='scrypt/pbkdf2/argon2; the cheap testing default isolates the database path')
+    args = parser.parse_args()
+    
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database_url or f"sqlite:///{os.path.join(directory, 'signup.db')}"
+        app = create_app(database_url, args.hash_method)
+        stats = run(app, args.signups, args.threads, args.duplicate_every)
+    
+    print(
+        f"{stats['signups']} signups on {args.threads} threads in {stats['seconds']:.2f}s: "
+        f"{stats['per_second']:.1f}/s, p50 {stats['p50_ms']:.1f}ms, p95 {stats['p95_ms']:.1f}ms, "
+        f"{stats['statements_per_signup']:.2f} statements per signup, statuses {stats['statuses']}"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,405 @@
+from collections import OrderedDict
+from flask import current_app
+import threading
+import logging
+import queue
+import json
+import time
+import uuid
+
+try:
+    import redis
+except ImportError:  # optional: caches stay process-local without redis-py
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+_redis_clients = {}
+_caches = {}
+_registry_lock = threading.Lock()
+
+# Deletes a lock only while it still holds the caller's token, so a loader
+# whose lock already expired can't release a lock another process now holds
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Extends a lock only while it still holds the caller's token
+RENEW_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with per-entry expiry"""
+    
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FakeRedis:
+    """
+    In-process stand-in for the subset of redis-py WagerWise uses
+    
+    Selected with REDIS_URL = 'memory://' (the testing default) so caching,
+    locking and expiry behave the same without a Redis server.
+    """
+    
+    def __init__(self):
+        self._data = {}
+        self._expiry = {}
+        self._subscribers = {}
+        self._lock = threading.RLock()
+    
+    def _expired(self, name):
+        expires_at = self._expiry.get(name)
+        if expires_at is not None and expires_at <= time.time():
+            self._data.pop(name, None)
+            self._expiry.pop(name, None)
+            return True
+        return name not in self._data
+    
+    def get(self, name):
+        with self._lock:
+            if self._expired(name):
+                return None
+            return self._data[name]
+    
+    def set(self, name, value, ex=None, px=None, nx=False):
+        with self._lock:
+            if nx and not self._expired(name):
+                return None
+            self._data[name] = value
+            self._expiry.pop(name, None)
+            if ex is not None:
+                self._expiry[name] = time.time() + ex
+            elif px is not None:
+                self._expiry[name] = time.time() + px / 1000.0
+            return True
+    
+    def delete(self, *names):
+        with self._lock:
+            deleted = 0
+            for name in names:
+                if not self._expired(name):
+                    deleted += 1
+                self._data.pop(name, None)
+                self._expiry.pop(name, None)
+            return deleted
+    
+    def delete_if_equal(self, name, value):
+        """Atomic equivalent of RELEASE_LOCK_SCRIPT"""
+        with self._lock:
+            if self._expired(name) or self._data[name] != value:
+                return 0
+            return self.delete(name)
+    
+    def pexpire_if_equal(self, name, value, px):
+        """Atomic equivalent of RENEW_LOCK_SCRIPT"""
+        with self._lock:
+            if self._expired(name) or self._data[name] != value:
+                return 0
+            self._expiry[name] = time.time() + px / 1000.0
+            return 1
+    
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+            self._expiry.clear()
+    
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber.messages.put({'type': 'message', 'channel': channel, 'data': message})
+        return len(subscribers)
+    
+    def pubsub(self, **kwargs):
+        return FakePubSub(self)
+
+
+class FakePubSub:
+    """In-process stand-in for redis-py's PubSub (delivers within one process only)"""
+    
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.channels = set()
+        self.messages = queue.Queue()
+    
+    def subscribe(self, *channels):
+        with self.redis._lock:
+            for channel in channels:
+                self.redis._subscribers.setdefault(channel, set()).add(self)
+                self.channels.add(channel)
+    
+    def unsubscribe(self, *channels):
+        with self.redis._lock:
+            for channel in channels or tuple(self.channels):
+                self.redis._subscribers.get(channel, set()).discard(self)
+                self.channels.discard(channel)
+    
+    def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            return self.messages.get(timeout=timeout) if timeout else self.messages.get_nowait()
+        except queue.Empty:
+            return None
+    
+    def close(self):
+        self.unsubscribe()
+
+
+def get_redis():
+    """Return the process-wide Redis client for REDIS_URL"""
+    url = current_app.config['REDIS_URL']
+    
+    with _registry_lock:
+        client = _redis_clients.get(url)
+        if client is None:
+            if url.startswith('memory://') or redis is None:
+                if redis is None and not url.startswith('memory://'):
+                    logger.warning('redis-py is not installed, using in-process cache only')
+                client = FakeRedis()
+            else:
+                client = redis.Redis.from_url(url, decode_responses=True)
+            _redis_clients[url] = client
+    return client
+
+
+def lock_releaser(client):
+    """Return release(name, token), an atomic compare-and-delete for a Redis lock"""
+    if isinstance(client, FakeRedis):
+        return client.delete_if_equal
+    script = client.register_script(RELEASE_LOCK_SCRIPT)
+    return lambda name, token: script(keys=[name], args=[token])
+
+
+def lock_renewer(client):
+    """Return renew(name, token, px), an atomic compare-and-pexpire for a Redis lock"""
+    if isinstance(client, FakeRedis):
+        return client.pexpire_if_equal
+    script = client.register_script(RENEW_LOCK_SCRIPT)
+    return lambda name, token, px: script(keys=[name], args=[token, px])
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one in-process call"""
+    
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+    
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'event': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+        
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+        
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+
+class TieredCache:
+    """
+    Two-tier cache: in-process LRU in front of Redis
+    
+    Values are stored in Redis as JSON together with their expiry time so the
+    local tier never outlives the shared entry. get_or_set() is single-flight
+    both within a process and across processes (via a Redis lock that the
+    loader keeps renewing while it runs).
+    """
+    
+    def __init__(self, namespace, redis_client, maxsize=1024, lock_timeout=10):
+        self.namespace = namespace
+        self.redis = redis_client
+        self.local = LRUCache(maxsize)
+        self.lock_timeout = lock_timeout
+        self._release_lock = lock_releaser(redis_client)
+        self._renew_lock = lock_renewer(redis_client)
+        self._flight = SingleFlight()
+    
+    def _key(self, key):
+        return f'wagerwise:{self.namespace}:{key}'
+    
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is not MISSING:
+            return value
+        
+        try:
+            raw = self.redis.get(self._key(key))
+        except Exception as e:
+            logger.warning(f'Redis cache read failed for {self.namespace}: {str(e)}')
+            return default
+        
+        if raw is None:
+            return default
+        
+        entry = json.loads(raw)
+        self.local.set(key, entry['value'], entry['expires_at'])
+        return entry['value']
+    
+    def set(self, key, value, ttl):
+        expires_at = time.time() + ttl
+        self.local.set(key, value, expires_at)
+        try:
+            self.redis.set(
+                self._key(key),
+                json.dumps({'value': value, 'expires_at': expires_at}),
+                px=max(int(ttl * 1000), 1)
+            )
+        except Exception as e:
+            logger.warning(f'Redis cache write failed for {self.namespace}: {str(e)}')
+    
+    def delete(self, key):
+        self.local.delete(key)
+        try:
+            self.redis.delete(self._key(key))
+        except Exception as e:
+            logger.warning(f'Redis cache delete failed for {self.namespace}: {str(e)}')
+    
+    def get_or_set(self, key, loader, ttl):
+        """Return the cached value for key, calling loader at most once on a miss"""
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        return self._flight.do(key, lambda: self._load(key, loader, ttl))
+    
+    def _load(self, key, loader, ttl):
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        
+        lock_key = self._key(f'{key}:lock')
+        token = str(uuid.uuid4())
+        lock_ms = max(int(self.lock_timeout * 1000), 1)
+        try:
+            locked = self.redis.set(lock_key, token, px=lock_ms, nx=True)
+        except Exception as e:
+            logger.warning(f'Redis lock failed for {self.namespace}: {str(e)}')
+            locked = True
+            lock_key = None
+        
+        if not locked:
+            # Another process is loading this key; wait for its result for as
+            # long as it keeps its lock alive
+            while self._lock_held(lock_key):
+                time.sleep(0.05)
+                value = self.get(key, MISSING)
+                if value is not MISSING:
+                    return value
+            value = self.get(key, MISSING)
+            if value is not MISSING:
+                return value
+        
+        stop_renewing = threading.Event()
+        if locked and lock_key:
+            threading.Thread(
+                target=self._keep_lock,
+                args=(lock_key, token, lock_ms, stop_renewing),
+                daemon=True
+            ).start()
+        try:
+            value = loader()
+            self.set(key, value, ttl)
+            return value
+        finally:
+            stop_renewing.set()
+            if locked and lock_key:
+                try:
+                    self._release_lock(lock_key, token)
+                except Exception as e:
+                    logger.warning(f'Redis unlock failed for {self.namespace}: {str(e)}')
+    
+    def _lock_held(self, lock_key):
+        try:
+            return self.redis.get(lock_key) is not None
+        except Exception as e:
+            logger.warning(f'Redis lock check failed for {self.namespace}: {str(e)}')
+            return False
+    
+    def _keep_lock(self, lock_key, token, lock_ms, stop):
+        """Renew a loader's lock until stop is set or the lock is lost"""
+        while not stop.wait(lock_ms / 3000.0):
+            try:
+                if not self._renew_lock(lock_key, token, lock_ms):
+                    logger.warning(f'Lost load lock {lock_key}')
+                    return
+            except Exception as e:
+                logger.warning(f'Redis lock renewal failed for {self.namespace}: {str(e)}')
+
+
+def get_cache(namespace, lock_timeout=10):
+    """
+    Return the process-wide TieredCache for a namespace
+    
+    A loader's lock expires lock_timeout seconds after its last renewal (it is
+    renewed every lock_timeout / 3 while the loader runs). Other processes
+    wait on the loader however long it takes, and load themselves within
+    lock_timeout of a loader dying.
+    """
+    registry_key = (current_app.config['REDIS_URL'], namespace)
+    with _registry_lock:
+        cache = _caches.get(registry_key)
+    if cache is None:
+        cache = TieredCache(
+            namespace,
+            get_redis(),
+            maxsize=current_app.config['CACHE_LOCAL_MAXSIZE'],
+            lock_timeout=lock_timeout
+        )
+        with _registry_lock:
+            cache = _caches.setdefault(registry_key, cache)
+    return cache
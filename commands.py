@@ -0,0 +1,55 @@
+import click
+import stripe
+import logging
+import auth
+import payload_store
+import query_plans
+import reconcile
+
+logger = logging.getLogger(__name__)
+
+
+def register_commands(app):
+    """
+    Add the maintenance commands to an app's `flask` CLI
+    
+    Run them against the worker app, e.g.
+    `flask --app worker:create_worker_app requeue-webhooks evt_123`.
+    """
+    
+    @app.cli.command('requeue-webhooks')
+    @click.argument('stripe_event_ids', nargs=-1)
+    def requeue_webhooks(stripe_event_ids):
+        """Give parked (or the given) webhook events a fresh set of attempts"""
+        requeued = auth.requeue_webhook_events(list(stripe_event_ids))
+        click.echo(f'Requeued {requeued} webhook events')
+    
+    @app.cli.command('reconcile-subscriptions')
+    @click.option('--chunk-size', type=int, default=None, help='Subscriptions per bulk UPDATE')
+    def reconcile_subscriptions(chunk_size):
+        """Bring user subscription columns in line with Stripe"""
+        try:
+            totals = reconcile.reconcile_subscriptions(chunk_size)
+        except stripe.error.StripeError as e:
+            logger.error(f'Subscription reconciliation failed: {str(e)}')
+            raise SystemExit(1)
+        click.echo(
+            f"Reconciled {totals['subscriptions']} subscriptions: "
+            f"{totals['matched']} users matched, {totals['updated']} corrected"
+        )
+    
+    @app.cli.command('offload-payloads')
+    @click.option('--batch-size', type=int, default=500, help='Rows per transaction')
+    def offload_payloads(batch_size):
+        """Move api_response JSON still stored inline into the payload store"""
+        moved = payload_store.offload_legacy_payloads(batch_size)
+        click.echo(f'Offloaded {moved} inline payloads')
+    
+    @app.cli.command('check-query-plans')
+    def check_query_plans():
+        """Explain the hot queries; exits 1 if any scans a whole table"""
+        regressions = query_plans.check_query_plans()
+        if regressions:
+            click.echo(f"Sequential scans in: {', '.join(regressions)}")
+            raise SystemExit(1)
+        click.echo('All hot queries use indexes')
@@ -22,25 +22,88 @@ class Config:
     STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
     STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', '')
     STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
+    STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', '')  # e.g. a local fake Stripe server
+    RECONCILE_CHUNK_SIZE = int(os.getenv('RECONCILE_CHUNK_SIZE', 500))  # subscriptions per bulk UPDATE
+    STRIPE_WEBHOOK_BATCH_SIZE = int(os.getenv('STRIPE_WEBHOOK_BATCH_SIZE', 100))  # events per worker transaction
+    STRIPE_WEBHOOK_MAX_ATTEMPTS = int(os.getenv('STRIPE_WEBHOOK_MAX_ATTEMPTS', 5))  # then parked until requeued
+    STRIPE_WEBHOOK_RETRY_DELAY = int(os.getenv('STRIPE_WEBHOOK_RETRY_DELAY', 60))  # seconds, doubled per attempt
+    
+    # Password hashing: 'scrypt', 'pbkdf2' or 'argon2' (needs argon2-cffi)
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_SCRYPT_N = int(os.getenv('PASSWORD_SCRYPT_N', 32768))
+    PASSWORD_PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', 1000000))
+    PASSWORD_ARGON2_TIME_COST = int(os.getenv('PASSWORD_ARGON2_TIME_COST', 3))
+    PASSWORD_ARGON2_MEMORY_COST = int(os.getenv('PASSWORD_ARGON2_MEMORY_COST', 65536))  # KiB
+    PASSWORD_ARGON2_PARALLELISM = int(os.getenv('PASSWORD_ARGON2_PARALLELISM', 4))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))  # concurrent hashes per process
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32))  # beyond this, 503
     
     # Subscription Settings
     SUBSCRIPTION_PRICE = 150.00  # $150 USD
-    FREE_PREVIEW_REQUESTS = 1
+    FREE_PREVIEW_REQUESTS = int(os.getenv('FREE_PREVIEW_REQUESTS', os.getenv('FREE_ANALYSIS_LIMIT', 1)))
+    
+    # Rate limiting (analysis requests per user, sliding windows)
+    RATELIMIT_ENABLED = True
+    API_CALLS_PER_MINUTE = int(os.getenv('API_CALLS_PER_MINUTE', 60))
+    API_CALLS_PER_HOUR = int(os.getenv('API_CALLS_PER_HOUR', 1000))
+    PREVIEW_CALLS_PER_MINUTE = int(os.getenv('PREVIEW_CALLS_PER_MINUTE', 5))
+    PREVIEW_CALLS_PER_HOUR = int(os.getenv('PREVIEW_CALLS_PER_HOUR', 20))
     
     # Sportsbook API Configuration
     SPORTSBOOK_API_HOST = 'sportsbook-api2.p.rapidapi.com'
     SPORTSBOOK_API_KEY = os.getenv('SPORTSBOOK_API_KEY', '75d09b10f1mshd3fbf8473b9518dp1c1e46jsn4f072b70e6fd')
     SPORTSBOOK_API_ENDPOINT = 'https://sportsbook-api2.p.rapidapi.com/v0/advantages/'
+    SPORTSBOOK_API_TIMEOUT = 10  # read timeout, seconds
+    SPORTSBOOK_API_CONNECT_TIMEOUT = 3.05  # seconds
+    SPORTSBOOK_POOL_MAXSIZE = int(os.getenv('SPORTSBOOK_POOL_MAXSIZE', 10))  # keep-alive connections per process
+    
+    # Redis ('memory://' uses an in-process fake, for tests only)
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    
+    # Cache TTLs (seconds)
+    CACHE_TTL_ODDS = int(os.getenv('CACHE_TTL_ODDS', 10))
+    SNAPSHOT_WINDOW_SECONDS = CACHE_TTL_ODDS  # all-bets analyses in one window share a result
+    CACHE_TTL_USER_DATA = int(os.getenv('CACHE_TTL_USER_DATA', 300))  # dropped early when the user changes
+    CACHE_USER_TOMBSTONE_TTL = int(os.getenv('CACHE_USER_TOMBSTONE_TTL', 10))  # refills racing a change are refused this long
+    CACHE_LOCAL_MAXSIZE = 1024  # entries per in-process cache
     
     # Ollama Configuration
     OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
     OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama2')
+    OLLAMA_TIMEOUT = 120  # read timeout between streamed chunks, seconds
+    OLLAMA_CONNECT_TIMEOUT = 3.05  # seconds
+    OLLAMA_FLUSH_INTERVAL = 1.0  # seconds between partial result writes
+    OLLAMA_POOL_MAXSIZE = 4
+    OLLAMA_MAX_CONCURRENCY = int(os.getenv('OLLAMA_MAX_CONCURRENCY', 2))  # generations across all workers (per process without Redis)
+    OLLAMA_SLOT_LEASE = int(os.getenv('OLLAMA_SLOT_LEASE', 900))  # seconds before a dead worker's slot is reclaimed
+    OLLAMA_STATS_INTERVAL = int(os.getenv('OLLAMA_STATS_INTERVAL', 60))  # seconds between scheduler stats log lines
+    OLLAMA_CACHE_TTL = int(os.getenv('OLLAMA_CACHE_TTL', 3600))  # reuse identical analyses for this long
+    
+    # Analysis Worker
+    ANALYSIS_WORKER_PROCESSES = int(os.getenv('ANALYSIS_WORKER_PROCESSES', 1))
+    ANALYSIS_WORKER_THREADS = int(os.getenv('ANALYSIS_WORKER_THREADS', 4))
+    ANALYSIS_WORKER_POLL_INTERVAL = float(os.getenv('ANALYSIS_WORKER_POLL_INTERVAL', 2))
+    ANALYSIS_CLAIM_TIMEOUT = int(os.getenv('ANALYSIS_CLAIM_TIMEOUT', 600))  # seconds before a claim is retried
+    
+    # Analysis Engine
+    MIN_EXPECTED_VALUE = 0.02  # minimum EV per unit stake to recommend a bet
+    MIN_ARBITRAGE_PROFIT = 1.5  # minimum arbitrage profit %
+    MAX_ODDS_AGE_MINUTES = 5  # ignore prices not seen for this long
+    MAX_RECOMMENDATIONS = 10
+    
+    # Raw sportsbook payloads are stored compressed outside bet_analysis
+    PAYLOAD_COMPRESSION = os.getenv('PAYLOAD_COMPRESSION', 'zstd')  # falls back to gzip without zstandard
+    
+    # Analysis status streaming (Server-Sent Events)
+    ANALYSIS_EVENTS_TIMEOUT = 60  # seconds before the stream closes and the client reconnects
+    ANALYSIS_EVENTS_HEARTBEAT = 15  # seconds between keep-alives / status re-checks
     
     # Logging
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     
     # Pagination
     ITEMS_PER_PAGE = 20
+    HISTORY_COUNT_TOTAL = os.getenv('HISTORY_COUNT_TOTAL', 'true').lower() == 'true'  # False skips COUNT(*) per page
     
     # File Upload
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max
@@ -58,6 +121,9 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    REDIS_URL = 'memory://'  # in-process fake, no Redis server needed
+    PASSWORD_HASH_METHOD = 'pbkdf2'
+    PASSWORD_PBKDF2_ITERATIONS = 1000  # fast hashes for tests
 
 
 class ProductionConfig(Config):
@@ -0,0 +1,69 @@
+from flask import current_app
+from cache import get_redis
+import logging
+import json
+import time
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ('completed', 'failed')
+
+
+def analysis_channel(analysis_id):
+    return f'wagerwise:analysis:{analysis_id}'
+
+
+def publish_status(analysis_ids, status):
+    """Tell subscribers that analyses moved to a new status"""
+    try:
+        client = get_redis()
+        message = json.dumps({'status': status})
+        for analysis_id in analysis_ids:
+            client.publish(analysis_channel(analysis_id), message)
+    except Exception as e:
+        # Subscribers fall back to re-checking the database
+        logger.warning(f'Failed to publish analysis status: {str(e)}')
+
+
+def format_event(event, data):
+    """Encode one Server-Sent Event"""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def analysis_event_stream(analysis_id, load_status, load_result):
+    """
+    Yield Server-Sent Events for an analysis until it finishes
+    
+    Sends the current status, then one event per published transition, and
+    the full result exactly once when the analysis completes or fails.
+    load_status() is re-checked every ANALYSIS_EVENTS_HEARTBEAT seconds in
+    case a publish was missed; the stream ends after ANALYSIS_EVENTS_TIMEOUT
+    and the client's EventSource reconnects.
+    """
+    heartbeat = current_app.config['ANALYSIS_EVENTS_HEARTBEAT']
+    deadline = time.monotonic() + current_app.config['ANALYSIS_EVENTS_TIMEOUT']
+    
+    subscription = get_redis().pubsub(ignore_subscribe_messages=True)
+    subscription.subscribe(analysis_channel(analysis_id))
+    try:
+        # Subscribe before reading so a transition can't slip in between
+        status = load_status()
+        yield f'retry: {heartbeat * 1000}\n\n'
+        yield format_event('status', {'status': status})
+        
+        while status not in FINAL_STATUSES and time.monotonic() < deadline:
+            message = subscription.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+            if message and message.get('type') == 'message':
+                new_status = json.loads(message['data'])['status']
+            else:
+                yield ': keep-alive\n\n'
+                new_status = load_status()
+            
+            if new_status != status:
+                status = new_status
+                yield format_event('status', {'status': status})
+        
+        if status in FINAL_STATUSES:
+            yield format_event('result', load_result())
+    finally:
+        subscription.close()
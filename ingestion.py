@@ -0,0 +1,94 @@
+from flask import current_app
+from odds import parse_markets, board_from_markets, value_bets
+from arbitrage import BestPriceIndex, scan_markets
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BoardState:
+    """
+    Scored view of the latest sportsbook board, updated incrementally
+    
+    Each refresh is diffed against the previous one by per-market
+    fingerprints; only markets whose quotes changed are re-scored for EV and
+    arbitrage. `version` increases whenever the board changes, so it can be
+    used to key anything derived from the board.
+    """
+    
+    def __init__(self):
+        self.version = 0
+        self._payload = None
+        self._fingerprints = {}
+        self._value_bets = {}
+        self._arbitrage = {}
+        self._index = BestPriceIndex()
+        self._lock = threading.Lock()
+    
+    def refresh(self, payload):
+        """Ingest a full board payload and re-score only the markets that moved"""
+        if payload is self._payload:
+            # Same cached payload object as the last refresh: nothing moved
+            return
+        
+        markets, outcomes = parse_markets(payload, current_app.config['MAX_ODDS_AGE_MINUTES'])
+        
+        with self._lock:
+            fingerprints = {
+                market: hash((tuple(sorted(quotes)), tuple(sorted(outcomes[market]))))
+                for market, quotes in markets.items()
+            }
+            changed = {
+                market: markets[market]
+                for market, fingerprint in fingerprints.items()
+                if self._fingerprints.get(market) != fingerprint
+            }
+            removed = set(self._fingerprints) - set(fingerprints)
+            
+            for market in removed:
+                self._value_bets.pop(market, None)
+                self._arbitrage.pop(market, None)
+                self._index.remove_market(market)
+            
+            if changed:
+                scored = {market: [] for market in changed}
+                for bet in value_bets(board_from_markets(changed, outcomes), current_app.config['MIN_EXPECTED_VALUE']):
+                    scored[bet['market']].append(bet)
+                self._value_bets.update(scored)
+                self._arbitrage.update(scan_markets(
+                    self._index,
+                    changed,
+                    current_app.config['MIN_ARBITRAGE_PROFIT'],
+                    outcomes
+                ))
+            
+            self._fingerprints = fingerprints
+            self._payload = payload
+            if changed or removed:
+                self.version += 1
+            
+            logger.info(
+                f'Board refresh: {len(changed)} changed, {len(removed)} removed, '
+                f'{len(markets)} markets (version {self.version})'
+            )
+    
+    def value_bets(self):
+        """Value bets across the board, best EV first"""
+        with self._lock:
+            bets = [bet for market_bets in self._value_bets.values() for bet in market_bets]
+        return sorted(bets, key=lambda bet: bet['expected_value'], reverse=True)
+    
+    def arbitrage(self):
+        """Arbitrage opportunities across the board, most profitable first"""
+        with self._lock:
+            found = [arbitrage for arbitrage in self._arbitrage.values() if arbitrage]
+        return sorted(found, key=lambda arbitrage: arbitrage['profit_percent'], reverse=True)
+
+
+_board_state = BoardState()
+
+
+def get_board_state():
+    """Return the process-wide BoardState"""
+    return _board_state
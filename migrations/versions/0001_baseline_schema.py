@@ -0,0 +1,126 @@
+"""baseline schema
+
+The tables db.create_all() produced before migrations were added. Databases
+created that way already match it: run `flask db stamp 0001` once, then
+`flask db upgrade` (with `--app worker:create_worker_app`).
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-17 12:31:49.633500
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('users',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('username', sa.String(length=80), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('password_hash', sa.String(length=255), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('stripe_customer_id', sa.String(length=255), nullable=True),
+    sa.Column('stripe_subscription_id', sa.String(length=255), nullable=True),
+    sa.Column('subscription_status', sa.String(length=50), nullable=False),
+    sa.Column('subscription_start_date', sa.DateTime(), nullable=True),
+    sa.Column('subscription_end_date', sa.DateTime(), nullable=True),
+    sa.Column('free_preview_used', sa.Integer(), nullable=True),
+    sa.Column('trial_ends_at', sa.DateTime(), nullable=True),
+    sa.Column('preferred_sports', sa.JSON(), nullable=True),
+    sa.Column('notification_preferences', sa.JSON(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('stripe_customer_id')
+    )
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_email'), ['email'], unique=True)
+        batch_op.create_index(batch_op.f('ix_users_username'), ['username'], unique=True)
+    
+    op.create_table('bet_analysis',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('analysis_type', sa.String(length=50), nullable=False),
+    sa.Column('sport', sa.String(length=100), nullable=True),
+    sa.Column('game', sa.String(length=255), nullable=True),
+    sa.Column('bet_legs', sa.JSON(), nullable=True),
+    sa.Column('api_response', sa.JSON(), nullable=True),
+    sa.Column('ollama_analysis', sa.Text(), nullable=True),
+    sa.Column('recommendations', sa.JSON(), nullable=True),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('error_message', sa.Text(), nullable=True),
+    sa.Column('processing_time', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('bet_analysis', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_bet_analysis_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_bet_analysis_user_id'), ['user_id'], unique=False)
+    
+    op.create_table('stripe_events',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('stripe_event_id', sa.String(length=255), nullable=False),
+    sa.Column('event_type', sa.String(length=100), nullable=False),
+    sa.Column('user_id', sa.String(length=36), nullable=True),
+    sa.Column('event_data', sa.JSON(), nullable=False),
+    sa.Column('processed', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stripe_events', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stripe_events_stripe_event_id'), ['stripe_event_id'], unique=True)
+        batch_op.create_index(batch_op.f('ix_stripe_events_user_id'), ['user_id'], unique=False)
+    
+    op.create_table('analysis_feedback',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('analysis_id', sa.String(length=36), nullable=False),
+    sa.Column('is_accurate', sa.Boolean(), nullable=False),
+    sa.Column('accuracy_score', sa.Integer(), nullable=True),
+    sa.Column('comments', sa.Text(), nullable=True),
+    sa.Column('actual_outcome', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['analysis_id'], ['bet_analysis.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('analysis_feedback', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_analysis_feedback_analysis_id'), ['analysis_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_analysis_feedback_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_analysis_feedback_user_id'), ['user_id'], unique=False)
+
+
+
+def downgrade():
+    with op.batch_alter_table('analysis_feedback', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_analysis_feedback_user_id'))
+        batch_op.drop_index(batch_op.f('ix_analysis_feedback_created_at'))
+        batch_op.drop_index(batch_op.f('ix_analysis_feedback_analysis_id'))
+    
+    op.drop_table('analysis_feedback')
+    with op.batch_alter_table('stripe_events', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stripe_events_user_id'))
+        batch_op.drop_index(batch_op.f('ix_stripe_events_stripe_event_id'))
+    
+    op.drop_table('stripe_events')
+    with op.batch_alter_table('bet_analysis', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_bet_analysis_user_id'))
+        batch_op.drop_index(batch_op.f('ix_bet_analysis_created_at'))
+    
+    op.drop_table('bet_analysis')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_username'))
+        batch_op.drop_index(batch_op.f('ix_users_email'))
+    
+    op.drop_table('users')
@@ -0,0 +1,135 @@
+"""analysis queue, snapshots, payload store and webhook queue
+
+Adds the worker claim and queue priority columns, shared analysis
+snapshots, the compressed payload store, parked webhook errors and the
+indexes behind the hot queries (see query_plans.py). The bet_analysis
+indexes are built CONCURRENTLY on PostgreSQL, outside the migration's
+transaction.
+
+The new tables may already exist where the app ran db.create_all() before
+this revision was applied; they are only created when missing.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:31:53.869740
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if not has_table('analysis_payloads'):
+        op.create_table('analysis_payloads',
+        sa.Column('digest', sa.String(length=64), nullable=False),
+        sa.Column('encoding', sa.String(length=20), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('digest')
+        )
+    
+    if not has_table('analysis_snapshots'):
+        op.create_table('analysis_snapshots',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('analysis_type', sa.String(length=50), nullable=False),
+        sa.Column('window_key', sa.String(length=100), nullable=False),
+        sa.Column('api_response_ref', sa.String(length=64), nullable=True),
+        sa.Column('api_response', sa.JSON(), nullable=True),
+        sa.Column('ollama_analysis', sa.Text(), nullable=True),
+        sa.Column('recommendations', sa.JSON(), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=False),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('processing_time', sa.Float(), nullable=True),
+        sa.Column('claimed_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['api_response_ref'], ['analysis_payloads.digest'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        with op.batch_alter_table('analysis_snapshots', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_analysis_snapshots_window_key'), ['window_key'], unique=True)
+    
+    with op.batch_alter_table('bet_analysis', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('snapshot_id', sa.String(length=36), nullable=True))
+        batch_op.add_column(sa.Column('api_response_ref', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('priority', sa.SmallInteger(), server_default='1', nullable=False))
+        batch_op.add_column(sa.Column('claimed_by', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('claimed_at', sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key('fk_bet_analysis_snapshot_id', 'analysis_snapshots', ['snapshot_id'], ['id'])
+        batch_op.create_foreign_key('fk_bet_analysis_api_response_ref', 'analysis_payloads', ['api_response_ref'], ['digest'])
+    
+    # bet_analysis is the largest table: on PostgreSQL build its indexes
+    # CONCURRENTLY (outside a transaction) so inserts aren't blocked meanwhile
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_bet_analysis_queue',
+            'bet_analysis',
+            ['status', 'priority', 'created_at'],
+            unique=False,
+            postgresql_where=sa.text("status = 'processing'"),
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            op.f('ix_bet_analysis_snapshot_id'),
+            'bet_analysis',
+            ['snapshot_id'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_bet_analysis_user_created',
+            'bet_analysis',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            unique=False,
+            postgresql_concurrently=True
+        )
+        # Superseded by ix_bet_analysis_user_created (user_id is its leading column)
+        op.drop_index(op.f('ix_bet_analysis_user_id'), table_name='bet_analysis', postgresql_concurrently=True)
+    
+    with op.batch_alter_table('stripe_events', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('error_message', sa.Text(), nullable=True))
+        batch_op.create_index('ix_stripe_events_queue', ['processed', 'created_at'], unique=False, postgresql_where=sa.text('NOT processed'))
+    
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_stripe_subscription_id'), ['stripe_subscription_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_stripe_subscription_id'))
+    
+    with op.batch_alter_table('stripe_events', schema=None) as batch_op:
+        batch_op.drop_index('ix_stripe_events_queue', postgresql_where=sa.text('NOT processed'))
+        batch_op.drop_column('error_message')
+    
+    op.drop_index('ix_bet_analysis_user_created', table_name='bet_analysis')
+    
+    with op.batch_alter_table('bet_analysis', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_bet_analysis_api_response_ref', type_='foreignkey')
+        batch_op.drop_constraint('fk_bet_analysis_snapshot_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_bet_analysis_snapshot_id'))
+        batch_op.drop_index('ix_bet_analysis_queue', postgresql_where=sa.text("status = 'processing'"))
+        batch_op.create_index(batch_op.f('ix_bet_analysis_user_id'), ['user_id'], unique=False)
+        batch_op.drop_column('claimed_at')
+        batch_op.drop_column('claimed_by')
+        batch_op.drop_column('priority')
+        batch_op.drop_column('api_response_ref')
+        batch_op.drop_column('snapshot_id')
+    
+    with op.batch_alter_table('analysis_snapshots', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_analysis_snapshots_window_key'))
+    
+    op.drop_table('analysis_snapshots')
+    op.drop_table('analysis_payloads')
@@ -1,11 +1,113 @@
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event, update
+from sqlalchemy.orm.attributes import set_committed_value
+from passwords import get_password_service
 from datetime import datetime, timedelta
+import hashlib
 import uuid
 
 db = SQLAlchemy()
 
+# Dialects that support SELECT ... FOR UPDATE SKIP LOCKED
+SKIP_LOCKED_DIALECTS = ('postgresql', 'mysql', 'oracle')
+
+
+def violated_unique_columns(error, table):
+    """
+    Columns of `table` whose unique constraint an IntegrityError violated
+    
+    Returns a tuple of column names, or None when the error isn't a
+    recognized unique violation on `table` (NOT NULL, foreign keys, other
+    tables). Uses the constraint name the driver reports on PostgreSQL and
+    MySQL, and the column list in SQLite's message.
+    """
+    orig = getattr(error, 'orig', error)
+    message = str(orig)
+    
+    if message.startswith('UNIQUE constraint failed: '):
+        # SQLite: "UNIQUE constraint failed: users.email[, users.other]"
+        qualified = message.split(': ', 1)[1].split(', ')
+        if all(name.startswith(f'{table.name}.') for name in qualified):
+            return tuple(name.split('.', 1)[1] for name in qualified)
+        return None
+    
+    constraint_name = getattr(getattr(orig, 'diag', None), 'constraint_name', None)
+    if constraint_name is None and "for key '" in message:
+        # MySQL: "Duplicate entry 'x' for key 'users.ix_users_email'"
+        constraint_name = message.rsplit("for key '", 1)[1].split("'", 1)[0].rsplit('.', 1)[-1]
+    if constraint_name is None:
+        return None
+    
+    for constraint in (*table.indexes, *table.constraints):
+        unique = isinstance(constraint, db.UniqueConstraint) or getattr(constraint, 'unique', False)
+        if unique and constraint.name == constraint_name:
+            return tuple(column.name for column in constraint.columns)
+    # Unnamed UNIQUE column constraints get PostgreSQL's default name
+    for column in table.columns:
+        if column.unique and constraint_name == f'{table.name}_{column.name}_key':
+            return (column.name,)
+    return None
+
+
+# Entitlement tiers
+TIER_PAID = 'paid'
+TIER_PREVIEW = 'preview'
+TIER_NONE = 'none'
+
+# Analysis queue and Ollama scheduler priorities (lower runs first)
+PRIORITY_PAID = 0
+PRIORITY_PREVIEW = 1
+
+
+class Entitlement:
+    """
+    Snapshot of what a user may do right now
+    
+    Computed once from the subscription columns so access checks in
+    decorators, routes and templates are attribute reads. User keeps its
+    snapshot until one of the columns it depends on changes or the instance
+    is expired/refreshed from the database.
+    """
+    __slots__ = ('tier', 'expires_at', 'remaining', 'is_active')
+    
+    def __init__(self, tier, expires_at, remaining, is_active):
+        self.tier = tier
+        self.expires_at = expires_at
+        self.remaining = remaining
+        self.is_active = is_active
+    
+    @classmethod
+    def compute(cls, is_active, subscription_status, subscription_end_date, free_preview_used, now=None):
+        """Derive the entitlement from raw subscription columns"""
+        now = now or datetime.utcnow()
+        if subscription_status == 'active' and subscription_end_date and subscription_end_date > now:
+            return cls(TIER_PAID, subscription_end_date, float('inf'), bool(is_active))
+        
+        used = free_preview_used or 0
+        limit = current_app.config['FREE_PREVIEW_REQUESTS']
+        if subscription_status == 'trial' and used < limit:
+            return cls(TIER_PREVIEW, None, limit - used, bool(is_active))
+        
+        return cls(TIER_NONE, None, 0, bool(is_active))
+    
+    @property
+    def has_access(self):
+        return self.is_active and self.tier != TIER_NONE
+    
+    def to_dict(self):
+        return {
+            'tier': self.tier,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'remaining': None if self.remaining == float('inf') else self.remaining,
+            'has_access': self.has_access
+        }
+
+
+# Columns an Entitlement is derived from
+ENTITLEMENT_COLUMNS = ('is_active', 'subscription_status', 'subscription_end_date', 'free_preview_used')
+
 
 class User(UserMixin, db.Model):
     """User model for authentication and subscription management"""
@@ -21,7 +123,7 @@ class User(UserMixin, db.Model):
     # Subscription fields
     is_active = db.Column(db.Boolean, default=False)
     stripe_customer_id = db.Column(db.String(255), unique=True, nullable=True)
-    stripe_subscription_id = db.Column(db.String(255), nullable=True)
+    stripe_subscription_id = db.Column(db.String(255), nullable=True, index=True)
     subscription_status = db.Column(
         db.String(50), 
         default='trial',
@@ -44,44 +146,138 @@ class User(UserMixin, db.Model):
     
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = get_password_service().hash(password)
     
     def check_password(self, password):
         """Check if provided password matches hash"""
-        return check_password_hash(self.password_hash, password)
+        return get_password_service().verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """Whether the stored hash predates the configured algorithm or cost"""
+        return get_password_service().needs_rehash(self.password_hash)
+    
+    @property
+    def entitlement(self):
+        """Entitlement snapshot, computed on first use"""
+        entitlement = self.__dict__.get('_entitlement')
+        if entitlement is None:
+            entitlement = Entitlement.compute(*(getattr(self, column) for column in ENTITLEMENT_COLUMNS))
+            self.__dict__['_entitlement'] = entitlement
+        return entitlement
     
     def has_active_subscription(self):
         """Check if user has active subscription"""
-        if self.subscription_status == 'active' and self.subscription_end_date:
-            return self.subscription_end_date > datetime.utcnow()
-        return False
+        return self.entitlement.tier == TIER_PAID
     
     def can_use_preview(self):
         """Check if user can use free preview"""
-        return self.free_preview_used < 1 and self.subscription_status == 'trial'
+        return self.entitlement.tier == TIER_PREVIEW
     
     def has_analysis_access(self):
         """Check if user has access to analysis tools"""
-        return self.is_active and (self.has_active_subscription() or self.can_use_preview())
+        return self.entitlement.has_access
     
     def get_remaining_requests(self):
         """Get remaining analysis requests for user"""
-        if self.has_active_subscription():
-            return float('inf')
-        elif self.can_use_preview():
-            return 1 - self.free_preview_used
-        return 0
+        return self.entitlement.remaining
+    
+    def consume_preview(self):
+        """
+        Atomically use one free preview request
+        
+        A single conditional UPDATE increments free_preview_used only while
+        it is below FREE_PREVIEW_REQUESTS, so concurrent requests can't both
+        take the last preview. Runs in the current transaction (a rollback
+        returns the preview); returns False when no preview is left.
+        """
+        statement = update(User).where(
+            User.id == self.id,
+            User.subscription_status == 'trial',
+            User.free_preview_used < current_app.config['FREE_PREVIEW_REQUESTS']
+        ).values(free_preview_used=User.free_preview_used + 1)
+        
+        if db.engine.dialect.update_returning:
+            used = db.session.execute(statement.returning(User.free_preview_used)).scalar()
+        else:
+            result = db.session.execute(statement)
+            used = (self.free_preview_used or 0) + 1 if result.rowcount == 1 else None
+        
+        if used is None:
+            return False
+        
+        # Mirror the new count without marking the user dirty: a flushed
+        # absolute value could overwrite a concurrent increment
+        set_committed_value(self, 'free_preview_used', used)
+        self.__dict__.pop('_entitlement', None)
+        
+        from user_cache import mark_user_changed
+        mark_user_changed(db.session(), self.id)
+        return True
+    
+    @staticmethod
+    def entitlements_for(user_ids=None, chunk_size=1000, now=None):
+        """
+        Compute entitlements for many users without loading full User rows
+        
+        Returns {user_id: Entitlement} for the given ids (every user when
+        user_ids is None) using one column-only query per chunk, for admin
+        and reporting jobs.
+        """
+        now = now or datetime.utcnow()
+        columns = [User.id] + [getattr(User, column) for column in ENTITLEMENT_COLUMNS]
+        
+        if user_ids is None:
+            rows = db.session.query(*columns).yield_per(chunk_size)
+        else:
+            user_ids = list(user_ids)
+            rows = (
+                row
+                for start in range(0, len(user_ids), chunk_size)
+                for row in db.session.query(*columns).filter(
+                    User.id.in_(user_ids[start:start + chunk_size])
+                )
+            )
+        
+        return {row[0]: Entitlement.compute(*row[1:], now=now) for row in rows}
     
     def __repr__(self):
         return f'<User {self.username}>'
 
 
+def _reset_entitlement(target, *args):
+    # Expiry can be reported for an instance that was already garbage collected
+    if target is None:
+        return
+    target.__dict__.pop('_entitlement', None)
+
+
+for _column in ENTITLEMENT_COLUMNS:
+    event.listen(getattr(User, _column), 'set', _reset_entitlement)
+event.listen(User, 'expire', _reset_entitlement)
+event.listen(User, 'refresh', _reset_entitlement)
+
+
 class BetAnalysis(db.Model):
     """Model for storing bet analysis requests and results"""
     __tablename__ = 'bet_analysis'
+    __table_args__ = (
+        # Per-user history, newest first (dashboard and keyset pagination)
+        db.Index('ix_bet_analysis_user_created', 'user_id', db.desc('created_at'), db.desc('id')),
+        # Worker queue: paid before preview, then oldest first (partial where supported)
+        db.Index(
+            'ix_bet_analysis_queue',
+            'status',
+            'priority',
+            'created_at',
+            postgresql_where=db.text("status = 'processing'")
+        ),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    
+    # Shared result for analyses that don't depend on user input (all_bets)
+    snapshot_id = db.Column(db.String(36), db.ForeignKey('analysis_snapshots.id'), nullable=True, index=True)
     
     # Analysis type
     analysis_type = db.Column(
@@ -96,10 +292,12 @@ class BetAnalysis(db.Model):
     # Bet legs (stored as JSON for flexibility)
     bet_legs = db.Column(db.JSON, default=list)
     
-    # API and Analysis Results
-    api_response = db.Column(db.JSON, nullable=True)
-    ollama_analysis = db.Column(db.Text, nullable=True)
-    recommendations = db.Column(db.JSON, nullable=True)
+    # API and Analysis Results (deferred: loaded together only when accessed)
+    # New payloads live in the payload store; api_response holds legacy rows
+    api_response_ref = db.Column(db.String(64), db.ForeignKey('analysis_payloads.digest'), nullable=True)
+    api_response = db.deferred(db.Column(db.JSON, nullable=True), group='results')
+    ollama_analysis = db.deferred(db.Column(db.Text, nullable=True), group='results')
+    recommendations = db.deferred(db.Column(db.JSON, nullable=True), group='results')
     
     # Metadata
     status = db.Column(
@@ -110,16 +308,115 @@ class BetAnalysis(db.Model):
     error_message = db.Column(db.Text, nullable=True)
     processing_time = db.Column(db.Float, nullable=True)
     
+    # Queue priority, fixed at enqueue time (lower is claimed first)
+    priority = db.Column(
+        db.SmallInteger,
+        default=PRIORITY_PREVIEW,
+        server_default=str(PRIORITY_PREVIEW),
+        nullable=False
+    )
+    
+    # Worker claim (set when an analysis worker picks the row up)
+    claimed_by = db.Column(db.String(100), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     completed_at = db.Column(db.DateTime, nullable=True)
     
     # Relationships
     feedback = db.relationship('AnalysisFeedback', backref='analysis', lazy='dynamic', cascade='all, delete-orphan')
     
+    @property
+    def result(self):
+        """Object holding this analysis' results (the shared snapshot if linked)"""
+        return self.snapshot if self.snapshot_id else self
+    
+    def status_etag(self):
+        """ETag for the status projection; changes only when the status does"""
+        material = f'{self.id}:{self.status}:{self.completed_at}'
+        return hashlib.sha1(material.encode('utf-8')).hexdigest()
+    
+    def get_api_response(self):
+        """Raw sportsbook payload, hydrated from the payload store when offloaded"""
+        return hydrate_api_response(self)
+    
+    def to_dict(self):
+        """Serialize the analysis and its results for the API"""
+        result = self.result
+        return {
+            'id': self.id,
+            'status': self.status,
+            'analysis_type': self.analysis_type,
+            'sport': self.sport,
+            'game': self.game,
+            'api_response': result.get_api_response(),
+            'ollama_analysis': result.ollama_analysis,
+            'recommendations': result.recommendations,
+            'created_at': self.created_at.isoformat(),
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+    
     def __repr__(self):
         return f'<BetAnalysis {self.id} - {self.analysis_type}>'
 
 
+class AnalysisSnapshot(db.Model):
+    """Analysis result shared by every request in the same odds refresh window"""
+    __tablename__ = 'analysis_snapshots'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    analysis_type = db.Column(db.String(50), nullable=False)
+    window_key = db.Column(db.String(100), unique=True, nullable=False, index=True)
+    
+    # API and Analysis Results
+    api_response_ref = db.Column(db.String(64), db.ForeignKey('analysis_payloads.digest'), nullable=True)
+    api_response = db.Column(db.JSON, nullable=True)
+    ollama_analysis = db.Column(db.Text, nullable=True)
+    recommendations = db.Column(db.JSON, nullable=True)
+    
+    # Metadata
+    status = db.Column(db.String(50), default='processing', nullable=False)
+    error_message = db.Column(db.Text, nullable=True)
+    processing_time = db.Column(db.Float, nullable=True)
+    claimed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationships
+    analyses = db.relationship('BetAnalysis', backref='snapshot', lazy='dynamic')
+    
+    def get_api_response(self):
+        """Raw sportsbook payload, hydrated from the payload store when offloaded"""
+        return hydrate_api_response(self)
+    
+    def __repr__(self):
+        return f'<AnalysisSnapshot {self.window_key}>'
+
+
+class AnalysisPayload(db.Model):
+    """Compressed, content-addressed sportsbook payload shared by analyses"""
+    __tablename__ = 'analysis_payloads'
+    
+    digest = db.Column(db.String(64), primary_key=True)  # sha256 of the canonical JSON
+    encoding = db.Column(db.String(20), nullable=False)  # 'zstd' or 'gzip'
+    data = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)  # uncompressed bytes
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AnalysisPayload {self.digest[:12]} ({self.encoding})>'
+
+
+def hydrate_api_response(record):
+    """Load a record's api_response from the payload store, or the legacy column"""
+    if record.api_response_ref:
+        from payload_store import load_payload
+        return load_payload(record.api_response_ref)
+    return record.api_response
+
+
 class AnalysisFeedback(db.Model):
     """Model for user feedback on analysis accuracy"""
     __tablename__ = 'analysis_feedback'
@@ -143,6 +440,15 @@ class AnalysisFeedback(db.Model):
 class StripeEvent(db.Model):
     """Model for tracking Stripe webhook events"""
     __tablename__ = 'stripe_events'
+    __table_args__ = (
+        # Webhook queue: oldest unprocessed events first
+        db.Index(
+            'ix_stripe_events_queue',
+            'processed',
+            'created_at',
+            postgresql_where=db.text('NOT processed')
+        ),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     stripe_event_id = db.Column(db.String(255), unique=True, nullable=False, index=True)
@@ -151,6 +457,9 @@ class StripeEvent(db.Model):
     
     event_data = db.Column(db.JSON, nullable=False)
     processed = db.Column(db.Boolean, default=False)
+    error_message = db.Column(db.Text, nullable=True)  # last processing failure
+    attempts = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # failed processing attempts
+    next_attempt_at = db.Column(db.DateTime, nullable=True)  # retry not before (backoff after a failure)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -0,0 +1,254 @@
+from datetime import datetime, timedelta
+import numpy as np
+
+
+def american_to_decimal(american):
+    """Convert American odds (+150, -110) to decimal odds"""
+    american = np.asarray(american, dtype=float)
+    return np.where(american > 0, 1 + american / 100, 1 + 100 / np.abs(american))
+
+
+def decimal_to_american(decimal):
+    """Convert decimal odds to American odds"""
+    decimal = np.asarray(decimal, dtype=float)
+    with np.errstate(divide='ignore'):
+        return np.where(decimal >= 2, (decimal - 1) * 100, -100 / (decimal - 1))
+
+
+def fractional_to_decimal(numerator, denominator):
+    """Convert fractional odds (numerator/denominator) to decimal odds"""
+    return 1 + np.asarray(numerator, dtype=float) / np.asarray(denominator, dtype=float)
+
+
+def parse_fractional(values):
+    """Convert fractional odds strings such as '5/2' to decimal odds"""
+    parts = np.char.partition(np.asarray(values, dtype=str), '/')
+    return fractional_to_decimal(parts[:, 0].astype(float), parts[:, 2].astype(float))
+
+
+def implied_probability(decimal):
+    """Bookmaker-implied probability of decimal odds (includes vig)"""
+    return 1 / np.asarray(decimal, dtype=float)
+
+
+def remove_vig(decimal, group):
+    """
+    Remove the bookmaker margin from each group of mutually exclusive prices
+    
+    `group` holds an integer code per price identifying the (market, book)
+    it belongs to. Returns (fair_probability, overround) where overround is
+    indexed by group code.
+    """
+    implied = implied_probability(decimal)
+    totals = np.bincount(group, weights=implied)
+    return implied / totals[group], totals - 1
+
+
+def expected_value(decimal, probability):
+    """Expected profit per unit stake of decimal odds at a given win probability"""
+    return np.asarray(probability, dtype=float) * np.asarray(decimal, dtype=float) - 1
+
+
+class OddsBoard:
+    """
+    Column-oriented view of every price on a sportsbook board
+    
+    Each price is one element of parallel NumPy arrays (decimal odds plus
+    integer codes for market, outcome and book), so scoring a whole board is
+    a handful of vectorized passes instead of per-leg Python loops.
+    """
+    
+    def __init__(self, decimal, markets, outcomes, books, market_codes, outcome_codes, book_codes, outcome_counts=None):
+        self.decimal = decimal
+        self.markets = markets          # market labels, indexed by market code
+        self.outcomes = outcomes        # (market label, outcome label), indexed by outcome code
+        self.books = books              # book labels, indexed by book code
+        self.market = market_codes      # market code per price
+        self.outcome = outcome_codes    # outcome code per price
+        self.book = book_codes          # book code per price
+        
+        # Outcomes each market offers, indexed by market code (at least those quoted)
+        outcome_market = np.zeros(len(outcomes), dtype=int)
+        outcome_market[outcome_codes] = market_codes
+        quoted = np.bincount(outcome_market, minlength=len(markets))
+        self.outcome_counts = quoted if outcome_counts is None else np.maximum(quoted, outcome_counts)
+    
+    def __len__(self):
+        return len(self.decimal)
+    
+    @classmethod
+    def from_prices(cls, prices, market_outcomes=None):
+        """
+        Build a board from (market, outcome, book, decimal_odds) tuples
+        
+        market_outcomes maps a market to every outcome it offers, including
+        outcomes with no usable price (see parse_markets()).
+        """
+        if not prices:
+            empty = np.array([], dtype=int)
+            return cls(np.array([], dtype=float), [], [], [], empty, empty, empty)
+        
+        market_labels, outcome_labels, book_labels, decimal = zip(*prices)
+        markets, market_codes = np.unique(np.array(market_labels, dtype=object), return_inverse=True)
+        books, book_codes = np.unique(np.array(book_labels, dtype=object), return_inverse=True)
+        outcome_keys = np.array(
+            [f'{market}\x1f{outcome}' for market, outcome in zip(market_labels, outcome_labels)],
+            dtype=object
+        )
+        outcome_keys, outcome_codes = np.unique(outcome_keys, return_inverse=True)
+        
+        outcome_counts = None
+        if market_outcomes is not None:
+            outcome_counts = np.array([len(market_outcomes.get(market, ())) for market in markets], dtype=int)
+        
+        return cls(
+            np.asarray(decimal, dtype=float),
+            list(markets),
+            [tuple(key.split('\x1f', 1)) for key in outcome_keys],
+            list(books),
+            market_codes.ravel(),
+            outcome_codes.ravel(),
+            book_codes.ravel(),
+            outcome_counts
+        )
+    
+    def score(self):
+        """
+        Vig-free consensus probability and EV for every price
+        
+        Each book's market is de-vigged independently, the fair
+        probabilities are averaged across books per outcome, and every
+        price is scored against that consensus. Books missing any outcome
+        of a market can't be de-vigged (their implied probabilities don't
+        sum over the whole market), so they are scored but don't contribute
+        to the consensus (NaN where no book contributes).
+        """
+        if not len(self):
+            empty = np.array([], dtype=float)
+            return {'fair_probability': empty, 'consensus_probability': empty, 'expected_value': empty}
+        
+        group = self.market * len(self.books) + self.book
+        _, group = np.unique(group, return_inverse=True)
+        group = group.ravel()
+        fair, _ = remove_vig(self.decimal, group)
+        complete = np.bincount(group)[group] >= np.maximum(self.outcome_counts[self.market], 2)
+        fair = np.where(complete, fair, np.nan)
+        
+        outcomes = len(self.outcomes)
+        counts = np.bincount(self.outcome, weights=complete, minlength=outcomes)
+        totals = np.bincount(self.outcome, weights=np.where(complete, fair, 0), minlength=outcomes)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            consensus = (totals / counts)[self.outcome]
+        
+        return {
+            'fair_probability': fair,
+            'consensus_probability': consensus,
+            'expected_value': expected_value(self.decimal, consensus)
+        }
+
+
+def parse_markets(payload, max_age_minutes=None, now=None):
+    """
+    Group an advantages payload into ({market: [(outcome, book, decimal_odds)]}, {market: outcomes})
+    
+    Markets are split by line (absolute modifier) so a spread or total is only
+    ever de-vigged or paired with its own opposite side. Quotes are
+    deduplicated per (outcome, book). A book's quotes for a market are
+    dropped together when any of them has a lastFoundAt older than
+    max_age_minutes, so a market is never priced from a mix of fresh and
+    stale sides. The outcome sets list every outcome offered on each
+    market, stale or not, so callers can tell when the remaining quotes
+    don't cover a market.
+    """
+    advantages = payload.get('advantages', []) if isinstance(payload, dict) else payload
+    cutoff = None
+    if max_age_minutes is not None:
+        cutoff = ((now or datetime.utcnow()) - timedelta(minutes=max_age_minutes)).strftime('%Y-%m-%dT%H:%M:%S')
+    
+    groups = {}
+    stale = set()
+    outcomes = {}
+    for advantage in advantages or []:
+        label = market_label(advantage)
+        for outcome in advantage.get('outcomes', []):
+            payout = outcome.get('payout')
+            book = outcome.get('source')
+            if not payout or not book:
+                continue
+            
+            modifier = outcome.get('modifier')
+            market = label
+            if isinstance(modifier, (int, float)) and modifier:
+                market = f'{label} | {abs(modifier):g}'
+            
+            name = outcome_label(outcome)
+            outcomes.setdefault(market, set()).add(name)
+            
+            found_at = outcome.get('lastFoundAt')
+            if cutoff and found_at and found_at[:19] < cutoff:
+                stale.add((market, book))
+            
+            quotes = groups.setdefault((market, book), {})
+            quotes.setdefault(name, float(payout))
+    
+    markets = {}
+    for (market, book), quotes in groups.items():
+        if (market, book) in stale:
+            continue
+        markets.setdefault(market, []).extend((name, book, price) for name, price in quotes.items())
+    
+    return markets, {market: frozenset(names) for market, names in outcomes.items()}
+
+
+def board_from_markets(markets, outcomes=None):
+    """Build an OddsBoard from parse_markets() output"""
+    return OddsBoard.from_prices([
+        (market, outcome, book, price)
+        for market, quotes in markets.items()
+        for outcome, book, price in quotes
+    ], outcomes)
+
+
+def value_bets(board, min_expected_value):
+    """Prices on a board whose EV against the consensus is at least min_expected_value"""
+    scores = board.score()
+    ev = scores['expected_value']
+    picks = np.flatnonzero(ev >= min_expected_value)
+    american = decimal_to_american(board.decimal[picks])
+    
+    return [
+        {
+            'type': 'value_bet',
+            'market': board.markets[board.market[i]],
+            'outcome': board.outcomes[board.outcome[i]][1],
+            'book': board.books[board.book[i]],
+            'decimal_odds': round(float(board.decimal[i]), 4),
+            'american_odds': int(round(float(american[n]))),
+            'fair_probability': round(float(scores['consensus_probability'][i]), 4),
+            'expected_value': round(float(ev[i]), 4)
+        }
+        for n, i in enumerate(picks)
+    ]
+
+
+def market_label(advantage):
+    """Stable label for the market an advantage entry refers to"""
+    market = advantage.get('market') or {}
+    event = market.get('event') or {}
+    return ' | '.join(
+        str(part) for part in (
+            event.get('name') or event.get('key'),
+            market.get('type'),
+            market.get('segment')
+        ) if part
+    )
+
+
+def outcome_label(outcome):
+    """Stable label for an outcome within its market (signed line included)"""
+    participant = outcome.get('participant') or {}
+    modifier = outcome.get('modifier')
+    parts = [outcome.get('type'), participant.get('name')]
+    if isinstance(modifier, (int, float)) and modifier:
+        parts.append(f'{modifier:+g}')
+    return ' '.join(str(part) for part in parts if part)
@@ -0,0 +1,272 @@
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from contextlib import contextmanager
+from cache import get_redis, FakeRedis
+from models import PRIORITY_PAID, PRIORITY_PREVIEW
+import requests
+import threading
+import itertools
+import logging
+import heapq
+import json
+import time
+import uuid
+import os
+
+logger = logging.getLogger(__name__)
+
+# Labels for scheduler logs and stats
+PRIORITY_NAMES = {PRIORITY_PAID: 'paid', PRIORITY_PREVIEW: 'preview'}
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+# Takes a slot in the global generation semaphore if one is free. Holders
+# are a sorted set scored by lease expiry, so slots held by a crashed
+# process are reclaimed. KEYS[1] is the set; ARGV is now, limit, lease
+# seconds and the holder token.
+ACQUIRE_SLOT_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[4])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3])))
+return 1
+"""
+
+
+class OllamaError(Exception):
+    """Raised when an Ollama generation fails"""
+
+
+def get_session():
+    """Return the process-wide keep-alive session for the Ollama server"""
+    global _session, _session_pid
+    
+    if _session is not None and _session_pid == os.getpid():
+        return _session
+    
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=current_app.config['OLLAMA_POOL_MAXSIZE'])
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+            _session_pid = os.getpid()
+    
+    return _session
+
+
+class RedisSemaphore:
+    """Counting semaphore shared by every process using the same Redis"""
+    
+    def __init__(self, client, key, limit, lease):
+        self.client = client
+        self.key = key
+        self.limit = limit
+        self.lease = lease
+        self.script = client.register_script(ACQUIRE_SLOT_SCRIPT)
+    
+    def acquire(self):
+        """Take a slot without blocking; returns its token, or None when all are held"""
+        token = uuid.uuid4().hex
+        acquired = self.script(keys=[self.key], args=[time.time(), self.limit, self.lease, token])
+        return token if int(acquired) else None
+    
+    def release(self, token):
+        self.client.zrem(self.key, token)
+    
+    def in_use(self):
+        return self.client.zcount(self.key, time.time(), '+inf')
+
+
+class OllamaScheduler:
+    """
+    Caps concurrent Ollama generations and admits waiters by priority
+    
+    Waiters are served lowest priority value first and FIFO within a
+    priority, so paid users queue ahead of preview users. With
+    global_slots (a RedisSemaphore) the cap applies across every worker
+    process: the head waiter polls for a global slot while the rest keep
+    their place in the local queue. Queue depth and per-priority wait
+    times are tracked for stats().
+    """
+    
+    def __init__(self, max_concurrency, global_slots=None, poll_interval=0.25):
+        self.max_concurrency = max_concurrency
+        self.global_slots = global_slots
+        self.poll_interval = poll_interval
+        self._active = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._waits = {}
+    
+    @contextmanager
+    def slot(self, priority=PRIORITY_PREVIEW):
+        """Block until a generation slot is free for this priority"""
+        entry = (priority, next(self._sequence))
+        enqueued = time.monotonic()
+        
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+            while True:
+                if self._queue[0] != entry or self._active >= self.max_concurrency:
+                    self._condition.wait()
+                    continue
+                token = self._acquire_global()
+                if token is not False:
+                    break
+                self._condition.wait(self.poll_interval)
+            heapq.heappop(self._queue)
+            self._active += 1
+            depth = len(self._queue)
+            waited = time.monotonic() - enqueued
+            count, total, longest = self._waits.get(priority, (0, 0.0, 0.0))
+            self._waits[priority] = (count + 1, total + waited, max(longest, waited))
+            self._condition.notify_all()
+        
+        logger.info(
+            f'Ollama slot acquired ({PRIORITY_NAMES.get(priority, priority)}) '
+            f'after {waited:.2f}s, queue depth {depth}'
+        )
+        try:
+            yield
+        finally:
+            if token:
+                try:
+                    self.global_slots.release(token)
+                except Exception as e:
+                    logger.warning(f'Ollama global slot release failed: {str(e)}')
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+    
+    def _acquire_global(self):
+        """Global slot token, None when not needed, or False while all are held"""
+        if self.global_slots is None:
+            return None
+        try:
+            return self.global_slots.acquire() or False
+        except Exception as e:
+            # Fail open to the per-process cap rather than stall generations
+            logger.warning(f'Ollama global slots unavailable: {str(e)}')
+            return None
+    
+    def stats(self):
+        """Current queue depth, active generations and wait times per priority"""
+        global_active = None
+        if self.global_slots is not None:
+            try:
+                global_active = self.global_slots.in_use()
+            except Exception as e:
+                logger.warning(f'Ollama global slots unavailable: {str(e)}')
+        
+        with self._condition:
+            return {
+                'active': self._active,
+                'global_active': global_active,
+                'max_concurrency': self.max_concurrency,
+                'queue_depth': len(self._queue),
+                'waits': {
+                    PRIORITY_NAMES.get(priority, str(priority)): {
+                        'count': count,
+                        'avg_wait': total / count,
+                        'max_wait': longest
+                    }
+                    for priority, (count, total, longest) in self._waits.items()
+                }
+            }
+
+
+def get_scheduler():
+    """Return the process-wide OllamaScheduler (capped globally when Redis is shared)"""
+    global _scheduler
+    
+    with _scheduler_lock:
+        if _scheduler is None:
+            config = current_app.config
+            client = get_redis()
+            global_slots = None
+            if not isinstance(client, FakeRedis):
+                global_slots = RedisSemaphore(
+                    client,
+                    'wagerwise:ollama:slots',
+                    config['OLLAMA_MAX_CONCURRENCY'],
+                    config['OLLAMA_SLOT_LEASE']
+                )
+            _scheduler = OllamaScheduler(config['OLLAMA_MAX_CONCURRENCY'], global_slots)
+    return _scheduler
+
+
+def priority_for_user(user):
+    """Scheduler priority for a user's generation (PRIORITY_PAID when there is no user)"""
+    if user is None or user.has_active_subscription():
+        return PRIORITY_PAID
+    return PRIORITY_PREVIEW
+
+
+class OllamaClient:
+    """Client for the Ollama generate API"""
+    
+    def __init__(self):
+        self.base_url = current_app.config['OLLAMA_BASE_URL'].rstrip('/')
+        self.model = current_app.config['OLLAMA_MODEL']
+        self.timeout = (
+            current_app.config['OLLAMA_CONNECT_TIMEOUT'],
+            current_app.config['OLLAMA_TIMEOUT']
+        )
+        self.flush_interval = current_app.config['OLLAMA_FLUSH_INTERVAL']
+        self.session = get_session()
+    
+    def stream(self, prompt):
+        """Yield generated text fragments as Ollama produces them"""
+        try:
+            with self.session.post(
+                f'{self.base_url}/api/generate',
+                json={'model': self.model, 'prompt': prompt, 'stream': True},
+                timeout=self.timeout,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise OllamaError(f"Ollama error: {chunk['error']}")
+                    if chunk.get('response'):
+                        yield chunk['response']
+                    if chunk.get('done'):
+                        return
+        except (requests.RequestException, ValueError) as e:
+            raise OllamaError(f'Ollama request failed: {str(e)}') from e
+    
+    def generate(self, prompt, on_partial=None, priority=PRIORITY_PREVIEW):
+        """
+        Generate a full response, reporting progress along the way
+        
+        Waits for a scheduler slot at the given priority first. on_partial(text)
+        is called with the text so far at most once per OLLAMA_FLUSH_INTERVAL
+        seconds (and once as soon as the first fragment arrives) so callers
+        can surface partial output.
+        """
+        parts = []
+        last_flush = None
+        
+        with get_scheduler().slot(priority):
+            for fragment in self.stream(prompt):
+                parts.append(fragment)
+                now = time.monotonic()
+                if on_partial and (last_flush is None or now - last_flush >= self.flush_interval):
+                    on_partial(''.join(parts))
+                    last_flush = now
+        
+        return ''.join(parts)
@@ -0,0 +1,75 @@
+from sqlalchemy import tuple_
+from datetime import datetime
+import base64
+import binascii
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor can't be decoded"""
+
+
+def encode_cursor(created_at, record_id):
+    """Opaque cursor pointing just past a (created_at, id) position"""
+    raw = f'{created_at.isoformat()}|{record_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, id) position encoded in a cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, record_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), record_id
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor}') from e
+
+
+class KeysetPage:
+    """
+    One page of keyset-paginated results, newest first
+    
+    Mirrors the parts of Flask-SQLAlchemy's Pagination that templates use
+    (items, has_next, total) and adds next_cursor for the following page.
+    Pages only link forward: there is no previous cursor. total is None
+    unless the page was built with a count.
+    """
+    
+    def __init__(self, items, per_page, next_cursor=None, cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+        self.total = total
+    
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+    
+    def __iter__(self):
+        return iter(self.items)
+
+
+def keyset_paginate(query, model, cursor=None, per_page=20, with_count=True):
+    """
+    Page through query ordered by (created_at, id) descending
+    
+    Each page seeks straight to the row after the cursor instead of
+    skipping OFFSET rows, so deep pages cost the same as the first. One
+    extra row is fetched to tell whether another page exists; the COUNT(*)
+    for total is only issued when with_count is set.
+    """
+    total = query.order_by(None).count() if with_count else None
+    
+    ordered = query.order_by(model.created_at.desc(), model.id.desc())
+    if cursor:
+        created_at, record_id = decode_cursor(cursor)
+        ordered = ordered.filter(tuple_(model.created_at, model.id) < (created_at, record_id))
+    
+    rows = ordered.limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    
+    return KeysetPage(items, per_page, next_cursor=next_cursor, cursor=cursor, total=total)
@@ -0,0 +1,111 @@
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+import os
+
+try:
+    import argon2
+except ImportError:  # optional: only needed when PASSWORD_HASH_METHOD = 'argon2'
+    argon2 = None
+
+logger = logging.getLogger(__name__)
+
+_service = None
+_service_pid = None
+_service_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    """Raised when too many password hashes are already queued"""
+
+
+class PasswordService:
+    """
+    Hashes and verifies passwords on a small dedicated thread pool
+    
+    Key derivation is deliberately slow. Running it on at most
+    PASSWORD_HASH_WORKERS threads caps how much CPU a login storm can take
+    from other requests. Callers beyond PASSWORD_HASH_MAX_PENDING are
+    refused with HashingBusy instead of piling up. The algorithm and cost
+    come from config; hashes made with other parameters still verify and
+    are reported by needs_rehash().
+    """
+    
+    def __init__(self, config):
+        self.method = config['PASSWORD_HASH_METHOD']
+        if self.method == 'argon2':
+            if argon2 is None:
+                raise RuntimeError('argon2-cffi is required for PASSWORD_HASH_METHOD = argon2')
+            self.argon2 = argon2.PasswordHasher(
+                time_cost=config['PASSWORD_ARGON2_TIME_COST'],
+                memory_cost=config['PASSWORD_ARGON2_MEMORY_COST'],
+                parallelism=config['PASSWORD_ARGON2_PARALLELISM']
+            )
+        elif self.method == 'scrypt':
+            self.werkzeug_method = f"scrypt:{config['PASSWORD_SCRYPT_N']}:8:1"
+        elif self.method == 'pbkdf2':
+            self.werkzeug_method = f"pbkdf2:sha256:{config['PASSWORD_PBKDF2_ITERATIONS']}"
+        else:
+            raise ValueError(f'Unknown password hash method: {self.method}')
+        
+        self.executor = ThreadPoolExecutor(
+            max_workers=config['PASSWORD_HASH_WORKERS'],
+            thread_name_prefix='password-hash'
+        )
+        self._slots = threading.BoundedSemaphore(config['PASSWORD_HASH_MAX_PENDING'])
+    
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Too many password operations in progress')
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+    
+    def _hash(self, password):
+        if self.method == 'argon2':
+            return self.argon2.hash(password)
+        return generate_password_hash(password, method=self.werkzeug_method)
+    
+    def _verify(self, password_hash, password):
+        if password_hash.startswith('$argon2'):
+            if argon2 is None:
+                logger.error('argon2 password hash found but argon2-cffi is not installed')
+                return False
+            try:
+                return argon2.PasswordHasher().verify(password_hash, password)
+            except argon2.exceptions.VerificationError:
+                return False
+        return check_password_hash(password_hash, password)
+    
+    def hash(self, password):
+        """Hash a password with the configured algorithm and cost"""
+        return self._run(self._hash, password)
+    
+    def verify(self, password_hash, password):
+        """Check a password against a hash made with any supported parameters"""
+        if not password_hash:
+            return False
+        return self._run(self._verify, password_hash, password)
+    
+    def needs_rehash(self, password_hash):
+        """Whether a hash was made with a different algorithm or cost than configured"""
+        if self.method == 'argon2':
+            return not password_hash.startswith('$argon2') or self.argon2.check_needs_rehash(password_hash)
+        return password_hash.split('$', 1)[0] != self.werkzeug_method
+
+
+def get_password_service():
+    """Return the process-wide PasswordService (recreated after fork)"""
+    global _service, _service_pid
+    
+    if _service is not None and _service_pid == os.getpid():
+        return _service
+    
+    with _service_lock:
+        if _service is None or _service_pid != os.getpid():
+            _service = PasswordService(current_app.config)
+            _service_pid = os.getpid()
+    return _service
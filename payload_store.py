@@ -0,0 +1,127 @@
+from flask import current_app
+from sqlalchemy import null, update, bindparam
+from sqlalchemy.exc import IntegrityError
+from models import db, AnalysisPayload, BetAnalysis, AnalysisSnapshot
+from cache import LRUCache, MISSING
+import hashlib
+import logging
+import json
+import gzip
+
+try:
+    import zstandard
+except ImportError:  # optional: payloads are gzip-compressed without it
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Payloads are immutable, so hydrated copies never expire; LRU bounds memory
+_hydrated = LRUCache(maxsize=64)
+_stored = LRUCache(maxsize=1024)
+NEVER = float('inf')
+
+
+def compress(raw):
+    """Compress bytes with the configured codec; returns (encoding, data)"""
+    if current_app.config['PAYLOAD_COMPRESSION'] == 'zstd' and zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor().compress(raw)
+    return 'gzip', gzip.compress(raw)
+
+
+def decompress(encoding, data):
+    if encoding == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to read zstd payloads')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def store_payload(value):
+    """
+    Store a JSON-serializable payload and return its digest
+    
+    Payloads are addressed by the sha256 of their canonical JSON, so
+    identical boards fetched by many analyses are stored once.
+    """
+    return store_payloads([value])[0]
+
+
+def store_payloads(values):
+    """Store several payloads, checking which are already stored with one query"""
+    digests = []
+    missing = {}
+    for value in values:
+        raw = json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(raw).hexdigest()
+        digests.append(digest)
+        if _stored.get(digest) is MISSING:
+            missing[digest] = raw
+    
+    if missing:
+        stored = db.session.query(AnalysisPayload.digest).filter(AnalysisPayload.digest.in_(missing))
+        for digest, in stored:
+            # Only remember digests seen committed, never ones this transaction
+            # inserted, so a rollback can't leave a dangling reference cached
+            _stored.set(digest, True, NEVER)
+            del missing[digest]
+    
+    for digest, raw in missing.items():
+        encoding, data = compress(raw)
+        try:
+            with db.session.begin_nested():
+                db.session.add(AnalysisPayload(
+                    digest=digest,
+                    encoding=encoding,
+                    data=data,
+                    size=len(raw)
+                ))
+            logger.info(f'Stored payload {digest[:12]}: {len(raw)} -> {len(data)} bytes ({encoding})')
+        except IntegrityError:
+            pass  # stored concurrently by another worker
+    return digests
+
+
+def load_payload(digest):
+    """Return the payload stored under digest (None if missing)"""
+    value = _hydrated.get(digest)
+    if value is not MISSING:
+        return value
+    
+    payload = db.session.get(AnalysisPayload, digest)
+    if payload is None:
+        logger.warning(f'Payload {digest} not found')
+        return None
+    
+    value = json.loads(decompress(payload.encoding, payload.data))
+    _hydrated.set(digest, value, NEVER)
+    return value
+
+
+def offload_legacy_payloads(batch_size=500):
+    """Move api_response JSON still stored inline into the payload store"""
+    moved = 0
+    for model in (BetAnalysis, AnalysisSnapshot):
+        while True:
+            # Only the two columns needed: loading instances would lazy-load
+            # the deferred api_response once per row
+            records = db.session.query(model.id, model.api_response).filter(
+                model.api_response.isnot(None),
+                model.api_response_ref.is_(None)
+            ).limit(batch_size).all()
+            if not records:
+                break
+            
+            digests = store_payloads([api_response for _, api_response in records])
+            table = model.__table__
+            db.session.execute(
+                update(table).where(table.c.id == bindparam('record_id')).values(
+                    api_response_ref=bindparam('digest'),
+                    api_response=null()  # SQL NULL rather than JSON null
+                ),
+                [{'record_id': record_id, 'digest': digest} for (record_id, _), digest in zip(records, digests)]
+            )
+            db.session.commit()
+            moved += len(records)
+    
+    logger.info(f'Offloaded {moved} inline payloads')
+    return moved
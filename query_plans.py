@@ -0,0 +1,136 @@
+from sqlalchemy import or_, tuple_
+from models import db, BetAnalysis
+import logging
+import json
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Placeholder values: plans depend on the query shape, not on these
+SAMPLE_ID = '00000000-0000-0000-0000-000000000000'
+SAMPLE_TIME = datetime(2000, 1, 1)
+
+
+def hot_queries():
+    """The BetAnalysis queries served on every page view or worker poll"""
+    return {
+        'dashboard': BetAnalysis.query.filter_by(
+            user_id=SAMPLE_ID
+        ).order_by(BetAnalysis.created_at.desc()).limit(5),
+        'analysis_history': BetAnalysis.query.filter(
+            BetAnalysis.user_id == SAMPLE_ID,
+            tuple_(BetAnalysis.created_at, BetAnalysis.id) < (SAMPLE_TIME, SAMPLE_ID)
+        ).order_by(BetAnalysis.created_at.desc(), BetAnalysis.id.desc()).limit(21),
+        'get_analysis': BetAnalysis.query.filter_by(
+            id=SAMPLE_ID,
+            user_id=SAMPLE_ID
+        ),
+        'worker_claim': BetAnalysis.query.filter(
+            BetAnalysis.status == 'processing',
+            or_(BetAnalysis.claimed_at.is_(None), BetAnalysis.claimed_at < SAMPLE_TIME)
+        ).order_by(BetAnalysis.priority, BetAnalysis.created_at).limit(10),
+        'snapshot_waiters': BetAnalysis.query.with_entities(BetAnalysis.id).filter(
+            BetAnalysis.snapshot_id == SAMPLE_ID,
+            BetAnalysis.status == 'processing'
+        )
+    }
+
+
+def partial_indexes():
+    """Names of BetAnalysis indexes that are partial on PostgreSQL"""
+    return {
+        index.name for index in BetAnalysis.__table__.indexes
+        if index.dialect_options['postgresql']['where'] is not None
+    }
+
+
+def explain(query):
+    """
+    Return (plan_text, full_scans) for a query on the current database
+    
+    full_scans lists the tables (or, on Oracle, indexes) read end to end,
+    whether directly or by walking a whole index. Supports SQLite,
+    PostgreSQL, MySQL/MariaDB and Oracle. On PostgreSQL sequential scans
+    are disabled for the EXPLAIN so the result reflects whether an index
+    is usable at all, not the planner's choice for a small table.
+    """
+    dialect = db.engine.dialect.name
+    sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    
+    with db.engine.connect() as connection:
+        if dialect == 'sqlite':
+            rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}').fetchall()
+            details = [row[-1] for row in rows]
+            # "SEARCH" seeks into an index; any "SCAN" (even USING INDEX) reads it all
+            full_scans = [detail.split()[1] for detail in details if detail.startswith('SCAN ')]
+            return '\n'.join(details), full_scans
+        
+        if dialect == 'postgresql':
+            with connection.begin():
+                connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+                plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {sql}').scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            
+            full_scans = []
+            nodes = [plan[0]['Plan']]
+            while nodes:
+                node = nodes.pop()
+                # An index walked end to end without a condition is a scan too,
+                # unless the index is partial and its predicate is the filter
+                unbounded = (
+                    node['Node Type'] in ('Index Scan', 'Index Only Scan')
+                    and 'Index Cond' not in node
+                    and node['Index Name'] not in partial_indexes()
+                )
+                if node['Node Type'] == 'Seq Scan' or unbounded:
+                    full_scans.append(node['Relation Name'])
+                nodes.extend(node.get('Plans', []))
+            return json.dumps(plan, indent=2), full_scans
+        
+        if dialect in ('mysql', 'mariadb'):
+            plan = json.loads(connection.exec_driver_sql(f'EXPLAIN FORMAT=JSON {sql}').scalar())
+            
+            # access_type ALL reads the table, index reads a whole index
+            full_scans = []
+            nodes = [plan]
+            while nodes:
+                node = nodes.pop()
+                if isinstance(node, list):
+                    nodes.extend(node)
+                elif isinstance(node, dict):
+                    if node.get('access_type') in ('ALL', 'index'):
+                        full_scans.append(node['table_name'])
+                    nodes.extend(node.values())
+            return json.dumps(plan, indent=2), full_scans
+        
+        if dialect == 'oracle':
+            with connection.begin():
+                connection.exec_driver_sql(f"EXPLAIN PLAN SET STATEMENT_ID = 'query_plans' FOR {sql}")
+                rows = connection.exec_driver_sql(
+                    "SELECT operation, options, object_name FROM plan_table "
+                    "WHERE statement_id = 'query_plans' ORDER BY id"
+                ).fetchall()
+                connection.exec_driver_sql("DELETE FROM plan_table WHERE statement_id = 'query_plans'")
+            
+            full_scans = [
+                object_name for operation, options, object_name in rows
+                if (operation, options) in (('TABLE ACCESS', 'FULL'), ('INDEX', 'FULL SCAN'), ('INDEX', 'FAST FULL SCAN'))
+            ]
+            return '\n'.join(' '.join(part for part in row if part) for row in rows), full_scans
+    
+    raise NotImplementedError(f'EXPLAIN checks are not supported on {dialect}')
+
+
+def check_query_plans():
+    """Explain every hot query; returns the names of queries that scan a table"""
+    regressions = []
+    for name, query in hot_queries().items():
+        plan, full_scans = explain(query)
+        logger.debug(f'Plan for {name}:\n{plan}')
+        if full_scans:
+            logger.error(f'{name} performs a sequential scan on {", ".join(full_scans)}:\n{plan}')
+            regressions.append(name)
+        else:
+            logger.info(f'{name}: index scan')
+    return regressions
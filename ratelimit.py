@@ -0,0 +1,148 @@
+from flask import current_app
+from collections import deque
+from cache import get_redis, FakeRedis
+from models import TIER_PAID, TIER_PREVIEW
+import threading
+import logging
+import uuid
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+# Checks every window first and records the hit in all of them only when
+# each has room, so a request denied by the hourly limit doesn't use up
+# minute quota. KEYS are the window keys; ARGV is now, then a
+# (window_seconds, limit) pair per key, then a unique member id.
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local member = ARGV[#ARGV]
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[i * 2])
+    local limit = tonumber(ARGV[i * 2 + 1])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= limit then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        retry_after = math.max(retry_after, tonumber(oldest[2]) + window - now)
+    end
+end
+if retry_after > 0 then
+    return tostring(retry_after)
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, member)
+    redis.call('EXPIRE', key, math.ceil(tonumber(ARGV[i * 2])))
+end
+return '0'
+"""
+
+
+class RateLimitResult:
+    """Outcome of a rate limit check"""
+    
+    def __init__(self, allowed, retry_after=0):
+        self.allowed = allowed
+        self.retry_after = retry_after
+    
+    def __bool__(self):
+        return self.allowed
+
+
+class MemoryBackend:
+    """Sliding-window log per key in process memory (tests and single-process dev)"""
+    
+    def __init__(self):
+        self._hits = {}
+        self._lock = threading.Lock()
+    
+    def hit(self, keys, windows, now):
+        with self._lock:
+            retry_after = 0
+            logs = []
+            for key, (window, limit) in zip(keys, windows):
+                log = self._hits.setdefault(key, deque())
+                while log and log[0] <= now - window:
+                    log.popleft()
+                if len(log) >= limit:
+                    retry_after = max(retry_after, log[0] + window - now)
+                logs.append(log)
+            
+            if retry_after > 0:
+                return retry_after
+            for log in logs:
+                log.append(now)
+            return 0
+
+
+class RedisBackend:
+    """Sliding-window log per key in a Redis sorted set, updated atomically by a script"""
+    
+    def __init__(self, client):
+        self.script = client.register_script(SLIDING_WINDOW_SCRIPT)
+    
+    def hit(self, keys, windows, now):
+        args = [now]
+        for window, limit in windows:
+            args.extend((window, limit))
+        args.append(f'{now}:{uuid.uuid4().hex}')
+        return float(self.script(keys=keys, args=args))
+
+
+class SlidingWindowRateLimiter:
+    """
+    Per-user request limits by entitlement tier
+    
+    Every request is logged with its timestamp and allowed only if fewer
+    than `limit` requests fall in each trailing window. Unlike fixed
+    windows, this never lets a burst straddle a window boundary and double
+    the effective rate.
+    """
+    
+    def __init__(self, backend, limits):
+        self.backend = backend
+        self.limits = limits  # {tier: [(window_seconds, limit), ...]}
+    
+    def hit(self, user_id, tier, scope='analysis'):
+        """Record a request for user_id; returns a RateLimitResult"""
+        windows = self.limits.get(tier)
+        if not windows:
+            return RateLimitResult(True)
+        
+        closed = [window for window, limit in windows if limit <= 0]
+        if closed:
+            # A zero limit blocks the tier outright; the backends can only
+            # time a retry from a logged request
+            return RateLimitResult(False, math.ceil(max(closed)))
+        
+        # Hash tag keeps a user's windows in one cluster slot for the script
+        keys = [f'wagerwise:ratelimit:{scope}:{{{user_id}}}:{window}' for window, _ in windows]
+        try:
+            retry_after = self.backend.hit(keys, windows, time.time())
+        except Exception as e:
+            # Fail open: an unavailable limiter shouldn't take analyses down
+            logger.warning(f'Rate limiter unavailable: {str(e)}')
+            return RateLimitResult(True)
+        
+        if retry_after > 0:
+            return RateLimitResult(False, math.ceil(retry_after))
+        return RateLimitResult(True)
+
+
+def get_rate_limiter():
+    """Return the process-wide limiter for the configured Redis backend"""
+    global _limiter
+    
+    with _limiter_lock:
+        if _limiter is None:
+            config = current_app.config
+            client = get_redis()
+            backend = MemoryBackend() if isinstance(client, FakeRedis) else RedisBackend(client)
+            _limiter = SlidingWindowRateLimiter(backend, {
+                TIER_PAID: [(60, config['API_CALLS_PER_MINUTE']), (3600, config['API_CALLS_PER_HOUR'])],
+                TIER_PREVIEW: [(60, config['PREVIEW_CALLS_PER_MINUTE']), (3600, config['PREVIEW_CALLS_PER_HOUR'])]
+            })
+    return _limiter
@@ -0,0 +1,125 @@
+from flask import current_app
+from sqlalchemy import update, or_
+from models import db, User
+from auth import StripeManager, subscription_period_end
+from user_cache import mark_user_changed
+import stripe
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Stripe subscription status -> User.subscription_status (others are left alone)
+STATUS_MAP = {
+    'active': 'active',
+    'trialing': 'active',
+    'past_due': 'active',
+    'canceled': 'cancelled',
+    'unpaid': 'cancelled',
+    'incomplete_expired': 'cancelled'
+}
+
+
+def iter_stripe_subscriptions(page_size=100):
+    """Every subscription in the Stripe account, newest first, page by page"""
+    StripeManager()  # configures the API key and base
+    subscriptions = stripe.Subscription.list(limit=page_size, status='all')
+    for subscription in subscriptions.auto_paging_iter():
+        subscription = subscription.to_dict() if hasattr(subscription, 'to_dict') else subscription
+        customer = subscription.get('customer')
+        yield {
+            'id': subscription['id'],
+            'customer': customer.get('id') if isinstance(customer, dict) else customer,
+            'status': subscription['status'],
+            'period_end': subscription_period_end(subscription)
+        }
+
+
+def reconcile_chunk(subscriptions):
+    """
+    Correct the users referenced by one chunk of Stripe subscriptions
+    
+    A user is matched by the subscription id it stores. A user without one
+    takes the newest subscription of its Stripe customer (ignoring statuses
+    not in STATUS_MAP), and that id is stored so later chunks only match
+    exactly. Users whose status, end date
+    or subscription id differ are fixed with one executemany UPDATE.
+    Returns (matched, updated).
+    """
+    by_id = {subscription['id']: subscription for subscription in subscriptions}
+    newest_by_customer = {}
+    for subscription in subscriptions:
+        if subscription['status'] in STATUS_MAP:
+            newest_by_customer.setdefault(subscription['customer'], subscription)
+    
+    users = db.session.query(
+        User.id,
+        User.stripe_customer_id,
+        User.stripe_subscription_id,
+        User.subscription_status,
+        User.subscription_end_date
+    ).filter(or_(
+        User.stripe_subscription_id.in_(by_id),
+        User.stripe_customer_id.in_(newest_by_customer)
+    )).all()
+    
+    now = datetime.utcnow()
+    matched = 0
+    corrections = []
+    for user_id, customer_id, subscription_id, status, end_date in users:
+        if subscription_id:
+            subscription = by_id.get(subscription_id)
+        else:
+            subscription = newest_by_customer.get(customer_id)
+        if subscription is None or subscription['status'] not in STATUS_MAP:
+            continue
+        matched += 1
+        
+        expected = {
+            'stripe_subscription_id': subscription['id'],
+            'subscription_status': STATUS_MAP[subscription['status']],
+            'subscription_end_date': subscription['period_end'] or end_date
+        }
+        if (subscription_id, status, end_date) != tuple(expected.values()):
+            corrections.append({'id': user_id, 'updated_at': now, **expected})
+    
+    if corrections:
+        db.session.execute(update(User), corrections)
+        for correction in corrections:
+            mark_user_changed(db.session(), correction['id'])
+    db.session.commit()
+    return matched, len(corrections)
+
+
+def reconcile_subscriptions(chunk_size=None, page_size=100):
+    """
+    Bring User subscription columns in line with Stripe
+    
+    Streams all subscriptions with list auto-pagination and reconciles
+    them chunk_size at a time (one user query and at most one bulk UPDATE
+    and commit per chunk), so memory stays flat however many subscribers
+    there are.
+    """
+    chunk_size = chunk_size or current_app.config['RECONCILE_CHUNK_SIZE']
+    totals = {'subscriptions': 0, 'matched': 0, 'updated': 0}
+    chunk = []
+    
+    def flush():
+        matched, updated = reconcile_chunk(chunk)
+        totals['subscriptions'] += len(chunk)
+        totals['matched'] += matched
+        totals['updated'] += updated
+        chunk.clear()
+    
+    for subscription in iter_stripe_subscriptions(page_size):
+        chunk.append(subscription)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    
+    logger.info(
+        f"Reconciled {totals['subscriptions']} subscriptions: "
+        f"{totals['matched']} users matched, {totals['updated']} corrected"
+    )
+    return totals
@@ -0,0 +1,140 @@
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from models import db, BetAnalysis, AnalysisSnapshot
+from analysis import AnalysisRunner
+from events import publish_status
+from datetime import datetime, timedelta
+import calendar
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Analysis types whose result is identical for every user in a refresh window
+SHARED_ANALYSIS_TYPES = ('all_bets',)
+
+
+def snapshot_window_key(analysis):
+    """Key of the refresh window an analysis belongs to"""
+    window = current_app.config['SNAPSHOT_WINDOW_SECONDS']
+    created = calendar.timegm(analysis.created_at.utctimetuple())
+    return f'{analysis.analysis_type}:{created // window}'
+
+
+def claim_snapshot(analysis):
+    """
+    Get or create the snapshot for an analysis' window
+    
+    Returns (snapshot, owner) where owner is True when this caller must
+    compute the snapshot. The unique window_key makes creation race-free
+    across worker processes.
+    """
+    window_key = snapshot_window_key(analysis)
+    snapshot = AnalysisSnapshot.query.filter_by(window_key=window_key).first()
+    
+    if snapshot is None:
+        try:
+            with db.session.begin_nested():
+                snapshot = AnalysisSnapshot(
+                    analysis_type=analysis.analysis_type,
+                    window_key=window_key,
+                    status='processing'
+                )
+                db.session.add(snapshot)
+            return snapshot, True
+        except IntegrityError:
+            snapshot = AnalysisSnapshot.query.filter_by(window_key=window_key).one()
+    
+    if snapshot.status == 'processing':
+        # Take over snapshots whose owner died mid-computation
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=current_app.config['ANALYSIS_CLAIM_TIMEOUT'])
+        result = db.session.execute(
+            update(AnalysisSnapshot)
+            .where(
+                AnalysisSnapshot.id == snapshot.id,
+                AnalysisSnapshot.status == 'processing',
+                AnalysisSnapshot.claimed_at < stale_before
+            )
+            .values(claimed_at=now)
+        )
+        if result.rowcount == 1:
+            logger.info(f'Taking over stale snapshot {window_key}')
+            return snapshot, True
+    
+    return snapshot, False
+
+
+def finalize_linked_analyses(snapshot):
+    """Copy a finished snapshot's status onto every analysis still waiting on it"""
+    waiting = (
+        BetAnalysis.snapshot_id == snapshot.id,
+        BetAnalysis.status == 'processing'
+    )
+    analysis_ids = [
+        analysis_id for (analysis_id,) in
+        BetAnalysis.query.with_entities(BetAnalysis.id).filter(*waiting)
+    ]
+    if not analysis_ids:
+        return
+    
+    db.session.execute(
+        update(BetAnalysis)
+        .where(BetAnalysis.id.in_(analysis_ids), *waiting)
+        .values(
+            status=snapshot.status,
+            error_message=snapshot.error_message,
+            processing_time=snapshot.processing_time,
+            completed_at=snapshot.completed_at
+        )
+    )
+    db.session.commit()
+    publish_status(analysis_ids, snapshot.status)
+
+
+def compute_snapshot(snapshot):
+    """Run the analysis pipeline once for a snapshot"""
+    started = time.monotonic()
+    try:
+        AnalysisRunner().run(snapshot)
+        snapshot.status = 'completed'
+        snapshot.error_message = None
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f'Snapshot {snapshot.window_key} failed: {str(e)}')
+        snapshot = db.session.get(AnalysisSnapshot, snapshot.id)
+        snapshot.status = 'failed'
+        snapshot.error_message = str(e)
+    
+    snapshot.processing_time = time.monotonic() - started
+    snapshot.completed_at = datetime.utcnow()
+    db.session.commit()
+    logger.info(
+        f'Snapshot {snapshot.window_key} {snapshot.status} in {snapshot.processing_time:.2f}s'
+    )
+    return snapshot
+
+
+def process_shared_analysis(analysis):
+    """
+    Link an analysis to its window's snapshot, computing the snapshot if needed
+    
+    Only the owner runs the pipeline; every other analysis in the window is
+    completed by the owner's bulk update. The snapshot status is committed
+    before that update, and linkers re-read it after committing their link,
+    so no linked analysis is left behind.
+    """
+    snapshot, owner = claim_snapshot(analysis)
+    analysis.snapshot_id = snapshot.id
+    db.session.commit()
+    
+    if owner:
+        snapshot = compute_snapshot(snapshot)
+    else:
+        db.session.refresh(snapshot)
+        if snapshot.status == 'processing':
+            logger.info(f'Analysis {analysis.id} waiting on snapshot {snapshot.window_key}')
+            return
+    
+    finalize_linked_analyses(snapshot)
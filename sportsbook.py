@@ -0,0 +1,87 @@
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode
+from cache import get_cache
+import requests
+import threading
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+class SportsbookAPIError(Exception):
+    """Raised when the Sportsbook API request fails"""
+
+
+def get_session():
+    """
+    Return the process-wide Sportsbook API session
+    
+    The session keeps connections to RapidAPI alive between analysis jobs so
+    only the first request in a process pays the TCP/TLS handshake. A new
+    session is built after a fork so child processes never share sockets.
+    """
+    global _session, _session_pid
+    
+    if _session is not None and _session_pid == os.getpid():
+        return _session
+    
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=current_app.config['SPORTSBOOK_POOL_MAXSIZE'],
+                pool_block=True
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({
+                'X-RapidAPI-Key': current_app.config['SPORTSBOOK_API_KEY'],
+                'X-RapidAPI-Host': current_app.config['SPORTSBOOK_API_HOST'],
+                'Accept': 'application/json'
+            })
+            _session = session
+            _session_pid = os.getpid()
+            logger.info('Sportsbook API connection pool created')
+    
+    return _session
+
+
+class SportsbookClient:
+    """Client for the Sportsbook API advantages endpoint"""
+    
+    def __init__(self):
+        self.endpoint = current_app.config['SPORTSBOOK_API_ENDPOINT']
+        self.timeout = (
+            current_app.config['SPORTSBOOK_API_CONNECT_TIMEOUT'],
+            current_app.config['SPORTSBOOK_API_TIMEOUT']
+        )
+        self.session = get_session()
+    
+    def get_advantages(self, params=None):
+        """Fetch the advantages board"""
+        try:
+            response = self.session.get(self.endpoint, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise SportsbookAPIError(f'Sportsbook API request failed: {str(e)}') from e
+    
+    def get_cached_advantages(self, params=None):
+        """
+        Fetch the advantages board through the odds cache
+        
+        Concurrent callers within CACHE_TTL_ODDS share a single upstream call.
+        """
+        key = 'advantages:' + urlencode(sorted((params or {}).items()))
+        return get_cache('odds').get_or_set(
+            key,
+            lambda: self.get_advantages(params),
+            current_app.config['CACHE_TTL_ODDS']
+        )
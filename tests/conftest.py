@@ -0,0 +1,97 @@
+import importlib.util
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import auth
+import cache
+import ingestion
+import payload_store
+import ratelimit
+from config import TestingConfig
+from models import db, User
+from worker import create_worker_app
+
+
+def load_web_app_module():
+    """Import app.py by path (the legacy app/ package shadows it on sys.path)"""
+    module = sys.modules.get('wagerwise_app')
+    if module is None:
+        spec = importlib.util.spec_from_file_location('wagerwise_app', os.path.join(ROOT, 'app.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules['wagerwise_app'] = module
+    return module
+
+
+def reset_process_state():
+    """Forget process-wide caches so every test starts from an empty Redis and board"""
+    cache._redis_clients.clear()
+    cache._caches.clear()
+    payload_store._stored.clear()
+    payload_store._hydrated.clear()
+    auth._queued_events.clear()
+    auth._user_references.clear()
+    ingestion._board_state = ingestion.BoardState()
+    ratelimit._limiter = None
+
+
+@pytest.fixture
+def app():
+    """Worker application on a fresh in-memory database"""
+    reset_process_state()
+    app = create_worker_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+    reset_process_state()
+
+
+@pytest.fixture
+def web_app(tmp_path, monkeypatch):
+    """
+    Full web application on a fresh database
+    
+    Uses a file database so concurrent requests get their own connections,
+    and holds no app context so each request has its own g and login state.
+    """
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'app.db'}")
+    reset_process_state()
+    app = load_web_app_module().create_app('testing')
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    reset_process_state()
+
+
+def login(client, user_id):
+    """Log a test client in as a user without going through the login form"""
+    with client.session_transaction() as session:
+        session['_user_id'] = user_id
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def make_user():
+    """Create and commit a user, returning only its id"""
+    counter = iter(range(1, 1000000))
+    
+    def make_user(**values):
+        n = next(counter)
+        values.setdefault('username', f'user{n}')
+        values.setdefault('email', f'user{n}@example.com')
+        values.setdefault('password_hash', 'x')
+        values.setdefault('is_active', True)
+        user = User(**values)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+    
+    return make_user
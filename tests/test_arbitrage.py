@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+import numpy as np
+from analysis import AnalysisRunner
+from arbitrage import BestPriceIndex
+from ingestion import BoardState
+from models import BetAnalysis
+from odds import board_from_markets, value_bets
+
+NOW = datetime.utcnow()
+FRESH = NOW.strftime('%Y-%m-%dT%H:%M:%S')
+STALE = (NOW - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def three_way(book, home, draw, away, draw_found_at=FRESH):
+    return {
+        'market': {'type': 'ML', 'event': {'name': 'A vs B'}},
+        'outcomes': [
+            {'type': 'HOME', 'source': book, 'payout': home, 'lastFoundAt': FRESH},
+            {'type': 'DRAW', 'source': book, 'payout': draw, 'lastFoundAt': draw_found_at},
+            {'type': 'AWAY', 'source': book, 'payout': away, 'lastFoundAt': FRESH}
+        ]
+    }
+
+
+def test_stale_side_drops_the_whole_book(app):
+    # Both books' DRAW prices are stale: HOME/AWAY alone look like a 39% arbitrage
+    board = BoardState()
+    board.refresh({'advantages': [
+        three_way('FD', 3.6, 3.4, 2.8, draw_found_at=STALE),
+        three_way('DK', 3.4, 3.3, 2.9, draw_found_at=STALE)
+    ]})
+    
+    assert board.arbitrage() == []
+    assert board.value_bets() == []
+
+
+def test_incomplete_outcome_set_is_not_arbitrage(app):
+    # A third book only quotes two sides of the three-way market
+    board = BoardState()
+    board.refresh({'advantages': [
+        three_way('FD', 3.6, 3.4, 2.8, draw_found_at=STALE),
+        {
+            'market': {'type': 'ML', 'event': {'name': 'A vs B'}},
+            'outcomes': [
+                {'type': 'HOME', 'source': 'BM', 'payout': 3.5, 'lastFoundAt': FRESH},
+                {'type': 'AWAY', 'source': 'BM', 'payout': 2.9, 'lastFoundAt': FRESH}
+            ]
+        }
+    ]})
+    
+    assert board.arbitrage() == []
+
+
+def test_complete_market_arbitrage_is_found(app):
+    board = BoardState()
+    board.refresh({'advantages': [
+        three_way('FD', 3.6, 3.0, 2.2),
+        three_way('DK', 2.4, 4.2, 3.3)
+    ]})
+    
+    found = board.arbitrage()
+    assert len(found) == 1
+    assert {leg['outcome']: leg['book'] for leg in found[0]['legs']} == {
+        'HOME': 'FD', 'DRAW': 'DK', 'AWAY': 'DK'
+    }
+
+
+def test_recommendations_follow_the_latest_board(app):
+    board = BoardState()
+    analysis = BetAnalysis(analysis_type='all_bets')
+    board.refresh({'advantages': [three_way('FD', 3.6, 3.0, 2.2), three_way('DK', 2.4, 4.2, 3.3)]})
+    assert [r['type'] for r in AnalysisRunner().build_recommendations(analysis, board)].count('arbitrage') == 1
+    
+    # DK's prices move into line: the opportunity is gone on the next analysis
+    board.refresh({'advantages': [three_way('FD', 3.6, 3.0, 2.2), three_way('DK', 2.4, 3.0, 2.2)]})
+    assert board.arbitrage() == []
+    assert [r['type'] for r in AnalysisRunner().build_recommendations(analysis, board)].count('arbitrage') == 0
+
+
+def test_index_requires_every_outcome():
+    index = BestPriceIndex()
+    index.update_market('m', [('HOME', 'FD', 3.6), ('AWAY', 'DK', 2.9)], {'HOME', 'DRAW', 'AWAY'})
+    assert index.find_arbitrage('m') is None
+    
+    index.update_price('m', 'DRAW', 'DK', 4.2)
+    assert index.find_arbitrage('m')['profit_percent'] > 0
+
+
+def test_partial_books_do_not_set_the_consensus(app):
+    # BM's two-way prices would de-vig to a consensus far from the three-way market
+    board = BoardState()
+    board.refresh({'advantages': [
+        three_way('FD', 2.8, 3.4, 2.6),
+        {
+            'market': {'type': 'ML', 'event': {'name': 'A vs B'}},
+            'outcomes': [
+                {'type': 'HOME', 'source': 'BM', 'payout': 1.9, 'lastFoundAt': FRESH},
+                {'type': 'AWAY', 'source': 'BM', 'payout': 1.9, 'lastFoundAt': FRESH}
+            ]
+        }
+    ]})
+    
+    assert board.value_bets() == []
+
+
+def test_board_without_a_complete_book_has_no_consensus():
+    # Every book's DRAW price was dropped: nothing can be de-vigged
+    board = board_from_markets(
+        {'A vs B | ML': [('HOME', 'FD', 3.6), ('AWAY', 'FD', 2.8), ('HOME', 'DK', 3.4), ('AWAY', 'DK', 2.9)]},
+        {'A vs B | ML': frozenset({'HOME', 'DRAW', 'AWAY'})}
+    )
+    
+    assert np.isnan(board.score()['consensus_probability']).all()
+    assert value_bets(board, 0.02) == []
@@ -0,0 +1,95 @@
+import threading
+import time
+import sportsbook
+from cache import FakeRedis, TieredCache
+
+
+def test_lock_release_keeps_a_lock_taken_over_by_another_loader():
+    redis = FakeRedis()
+    cache = TieredCache('test', redis, lock_timeout=1)
+    lock_key = cache._key('key:lock')
+    
+    def loader():
+        # Our lock expired mid-load and another process took it
+        redis.set(lock_key, 'other-token', px=1000)
+        return 'value'
+    
+    assert cache.get_or_set('key', loader, 60) == 'value'
+    assert redis.get(lock_key) == 'other-token'
+
+
+def test_lock_released_after_load():
+    redis = FakeRedis()
+    cache = TieredCache('test', redis, lock_timeout=1)
+    
+    assert cache.get_or_set('key', lambda: 'value', 60) == 'value'
+    assert redis.get(cache._key('key:lock')) is None
+
+
+def test_waiters_outlast_the_lock_timeout_while_the_loader_runs():
+    # Two processes sharing Redis; the load takes several lock timeouts
+    redis = FakeRedis()
+    caches = [TieredCache('test', redis, lock_timeout=0.2) for _ in range(2)]
+    calls = []
+    results = []
+    
+    def loader():
+        calls.append(1)
+        time.sleep(0.8)
+        return 'value'
+    
+    threads = [
+        threading.Thread(target=lambda cache=cache: results.append(cache.get_or_set('key', loader, 60)))
+        for cache in caches
+    ]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join(5)
+    
+    assert results == ['value', 'value']
+    assert len(calls) == 1
+
+
+def test_waiter_loads_when_the_loader_dies():
+    redis = FakeRedis()
+    cache = TieredCache('test', redis, lock_timeout=0.2)
+    # Lock left behind by a loader that is no longer renewing it
+    redis.set(cache._key('key:lock'), 'dead-token', px=200)
+    
+    started = time.time()
+    assert cache.get_or_set('key', lambda: 'value', 60) == 'value'
+    assert time.time() - started < 1
+
+
+def test_concurrent_odds_requests_share_one_upstream_call(app, monkeypatch):
+    calls = []
+    
+    def get_advantages(self, params=None):
+        calls.append(params)
+        time.sleep(0.2)
+        return {'advantages': [], 'params': params}
+    
+    monkeypatch.setattr(sportsbook.SportsbookClient, 'get_advantages', get_advantages)
+    barrier = threading.Barrier(10)
+    results = []
+    
+    def fetch():
+        with app.app_context():
+            barrier.wait()
+            results.append(sportsbook.SportsbookClient().get_cached_advantages())
+    
+    threads = [threading.Thread(target=fetch) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    
+    assert len(calls) == 1
+    assert results == [{'advantages': [], 'params': None}] * 10
+    
+    # Still within CACHE_TTL_ODDS; other params are a separate entry
+    sportsbook.SportsbookClient().get_cached_advantages()
+    sportsbook.SportsbookClient().get_cached_advantages({'sport': 'nba'})
+    assert calls == [None, {'sport': 'nba'}]
@@ -0,0 +1,28 @@
+from models import db, BetAnalysis, StripeEvent
+
+
+def test_offload_payloads(app, make_user):
+    user_id = make_user()
+    db.session.add(BetAnalysis(user_id=user_id, analysis_type='all_bets', api_response={'board': 1}))
+    db.session.commit()
+    
+    result = app.test_cli_runner().invoke(args=['offload-payloads', '--batch-size', '10'])
+    assert result.exit_code == 0, result.output
+    assert 'Offloaded 1 inline payloads' in result.output
+
+
+def test_requeue_webhooks(app):
+    db.session.add(StripeEvent(stripe_event_id='evt_1', event_type='invoice.payment_succeeded', event_data={}, attempts=5))
+    db.session.add(StripeEvent(stripe_event_id='evt_2', event_type='invoice.payment_succeeded', event_data={}, attempts=5))
+    db.session.commit()
+    
+    result = app.test_cli_runner().invoke(args=['requeue-webhooks', 'evt_1'])
+    assert result.exit_code == 0, result.output
+    assert 'Requeued 1 webhook events' in result.output
+    db.session.expire_all()
+    assert [event.attempts for event in StripeEvent.query.order_by(StripeEvent.stripe_event_id)] == [0, 5]
+
+
+def test_check_query_plans(app):
+    result = app.test_cli_runner().invoke(args=['check-query-plans'])
+    assert result.exit_code == 0, result.output
@@ -0,0 +1,89 @@
+import os
+import warnings
+import pytest
+import sqlalchemy as sa
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask import Flask
+from flask_migrate import Migrate, upgrade, downgrade
+from models import db
+from conftest import ROOT, reset_process_state
+
+MIGRATIONS = os.path.join(ROOT, 'migrations')
+
+
+@pytest.fixture
+def migrate_app(tmp_path):
+    """Bare app on an empty file database (no create_all) for running migrations"""
+    reset_process_state()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'migrations.db'}"
+    db.init_app(app)
+    Migrate(app, db, render_as_batch=True)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # SQLite can't reflect descending (expression) indexes for comparison;
+    # index_sql() checks this one instead
+    return name != 'ix_bet_analysis_user_created'
+
+
+def schema_differences():
+    with db.engine.connect() as connection:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            context = MigrationContext.configure(connection, opts={
+                'compare_type': True,
+                'include_object': include_object
+            })
+            return compare_metadata(context, db.metadata)
+
+
+def index_sql(name):
+    with db.engine.connect() as connection:
+        return connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)
+        ).scalar()
+
+
+def index_names(table):
+    return {index['name'] for index in sa.inspect(db.engine).get_indexes(table)}
+
+
+def test_upgrade_to_head_matches_models(migrate_app):
+    upgrade(directory=MIGRATIONS)
+    
+    assert schema_differences() == []
+    assert 'user_id, created_at DESC, id DESC' in index_sql('ix_bet_analysis_user_created')
+    assert {
+        'ix_bet_analysis_user_created',
+        'ix_bet_analysis_queue',
+        'ix_bet_analysis_snapshot_id'
+    } <= index_names('bet_analysis')
+    assert 'ix_bet_analysis_user_id' not in index_names('bet_analysis')
+    assert 'ix_stripe_events_queue' in index_names('stripe_events')
+    assert 'ix_users_stripe_subscription_id' in index_names('users')
+
+
+def test_upgrade_after_create_all_tables(migrate_app):
+    # Deployments that ran create_all() with the new models before migrating
+    upgrade(directory=MIGRATIONS, revision='0001')
+    db.metadata.tables['analysis_payloads'].create(db.engine)
+    db.metadata.tables['analysis_snapshots'].create(db.engine)
+    
+    upgrade(directory=MIGRATIONS)
+    assert schema_differences() == []
+
+
+def test_downgrade_to_baseline(migrate_app):
+    upgrade(directory=MIGRATIONS)
+    downgrade(directory=MIGRATIONS, revision='0001')
+    
+    inspector = sa.inspect(db.engine)
+    assert not inspector.has_table('analysis_snapshots')
+    assert 'claimed_by' not in {column['name'] for column in inspector.get_columns('bet_analysis')}
+    assert 'ix_bet_analysis_user_id' in index_names('bet_analysis')
@@ -0,0 +1,80 @@
+import threading
+import time
+from models import PRIORITY_PAID, PRIORITY_PREVIEW
+from ollama_client import OllamaScheduler
+
+
+class SharedSlots:
+    """In-memory stand-in for RedisSemaphore shared by several schedulers"""
+    
+    def __init__(self, limit):
+        self.limit = limit
+        self.holders = set()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        with self.lock:
+            if len(self.holders) >= self.limit:
+                return None
+            token = object()
+            self.holders.add(token)
+            return token
+    
+    def release(self, token):
+        with self.lock:
+            self.holders.discard(token)
+    
+    def in_use(self):
+        return len(self.holders)
+
+
+def start_waiter(scheduler, priority, order, started):
+    def run():
+        started.set()
+        with scheduler.slot(priority):
+            order.append(priority)
+    
+    thread = threading.Thread(target=run)
+    thread.start()
+    started.wait()
+    return thread
+
+
+def test_paid_waiters_are_admitted_first():
+    scheduler = OllamaScheduler(1)
+    order = []
+    
+    with scheduler.slot(PRIORITY_PREVIEW):
+        threads = [
+            start_waiter(scheduler, PRIORITY_PREVIEW, order, threading.Event()),
+            start_waiter(scheduler, PRIORITY_PAID, order, threading.Event())
+        ]
+        while scheduler.stats()['queue_depth'] < 2:
+            time.sleep(0.01)
+    
+    for thread in threads:
+        thread.join(5)
+    assert order == [PRIORITY_PAID, PRIORITY_PREVIEW]
+    
+    stats = scheduler.stats()
+    assert stats['queue_depth'] == 0
+    assert stats['waits']['paid']['count'] == 1
+    assert stats['waits']['preview']['count'] == 2
+
+
+def test_global_slots_cap_generations_across_schedulers():
+    slots = SharedSlots(1)
+    first = OllamaScheduler(2, slots, poll_interval=0.01)
+    second = OllamaScheduler(2, slots, poll_interval=0.01)
+    order = []
+    
+    with first.slot(PRIORITY_PAID):
+        thread = start_waiter(second, PRIORITY_PAID, order, threading.Event())
+        time.sleep(0.1)
+        assert order == []
+        assert second.stats()['queue_depth'] == 1
+        assert first.stats()['global_active'] == 1
+    
+    thread.join(5)
+    assert order == [PRIORITY_PAID]
+    assert slots.in_use() == 0
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from models import db, BetAnalysis
+from pagination import encode_cursor, decode_cursor, keyset_paginate, InvalidCursor
+from conftest import login
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def history(app, make_user):
+    """Eight analyses for one user; several share a created_at"""
+    user_id = make_user()
+    offsets = [0, 1, 1, 1, 2, 3, 3, 4]
+    for n, offset in enumerate(offsets):
+        db.session.add(BetAnalysis(
+            id=f'00000000-0000-0000-0000-00000000000{n}',
+            user_id=user_id,
+            analysis_type='all_bets',
+            created_at=START + timedelta(minutes=offset)
+        ))
+    db.session.commit()
+    return BetAnalysis.query.filter_by(user_id=user_id)
+
+
+def newest_first(query):
+    return [analysis.id for analysis in query.order_by(BetAnalysis.created_at.desc(), BetAnalysis.id.desc())]
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(START, 'abc-123')
+    assert decode_cursor(cursor) == (START, 'abc-123')
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', encode_cursor(START, 'x')[:-4], 'bm8tc2VwYXJhdG9y'])
+def test_invalid_cursors(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_pages_walk_ties_without_gaps_or_repeats(history):
+    seen = []
+    cursor = None
+    while True:
+        page = keyset_paginate(history, BetAnalysis, cursor=cursor, per_page=3)
+        seen.extend(analysis.id for analysis in page)
+        assert page.total == 8
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+    
+    assert seen == newest_first(history)
+
+
+def test_exactly_full_last_page_has_no_next(history):
+    first = keyset_paginate(history, BetAnalysis, per_page=4)
+    second = keyset_paginate(history, BetAnalysis, cursor=first.next_cursor, per_page=4)
+    assert first.has_next
+    assert len(second.items) == 4
+    assert not second.has_next
+
+
+def test_without_count(history):
+    statements = []
+    
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        page = keyset_paginate(history, BetAnalysis, per_page=3, with_count=False)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    
+    assert page.total is None
+    assert len(statements) == 1
+    assert 'count(' not in statements[0].lower()
+
+
+def test_history_redirects_an_invalid_cursor(web_app, make_user):
+    with web_app.app_context():
+        user_id = make_user(subscription_status='trial')
+    client = login(web_app.test_client(), user_id)
+    
+    response = client.get('/analysis-history?cursor=not-a-cursor')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/analysis-history')
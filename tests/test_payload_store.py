@@ -0,0 +1,36 @@
+from sqlalchemy import event
+from models import db, AnalysisPayload, AnalysisSnapshot, BetAnalysis
+from payload_store import load_payload, offload_legacy_payloads
+
+
+def test_offload_legacy_payloads(app, make_user):
+    user_id = make_user()
+    for n in range(50):
+        db.session.add(BetAnalysis(user_id=user_id, analysis_type='all_bets', api_response={'board': n % 5}))
+    db.session.add(AnalysisSnapshot(analysis_type='all_bets', window_key='w1', api_response={'board': 0}))
+    db.session.commit()
+    db.session.expire_all()
+    
+    statements = []
+    
+    def count(*args):
+        statements.append(args[2])
+    
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        assert offload_legacy_payloads(batch_size=50) == 51
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    
+    # Per batch: the rows, one digest lookup, the new payloads (each in a
+    # savepoint) and one executemany UPDATE; nothing per offloaded row
+    assert len(statements) < 30, statements
+    assert AnalysisPayload.query.count() == 5
+    
+    db.session.expire_all()
+    analyses = BetAnalysis.query.order_by(BetAnalysis.created_at).all()
+    assert all(analysis.api_response is None for analysis in analyses)
+    assert sorted(load_payload(analysis.api_response_ref)['board'] for analysis in analyses) == sorted(n % 5 for n in range(50))
+    assert load_payload(AnalysisSnapshot.query.one().api_response_ref) == {'board': 0}
+    
+    assert offload_legacy_payloads() == 0
@@ -0,0 +1,43 @@
+import threading
+from models import db, User
+from conftest import login
+
+
+def test_concurrent_requests_use_one_preview(web_app, make_user):
+    web_app.config['RATELIMIT_ENABLED'] = False
+    with web_app.app_context():
+        user_id = make_user(subscription_status='trial')
+    
+    statuses = []
+    barrier = threading.Barrier(8)
+    
+    def analyze():
+        client = login(web_app.test_client(), user_id)
+        barrier.wait()
+        statuses.append(client.post('/api/analyze/all-bets').status_code)
+    
+    threads = [threading.Thread(target=analyze) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert sorted(statuses) == [202] + [403] * 7
+    with web_app.app_context():
+        assert db.session.get(User, user_id).free_preview_used == 1
+
+
+def test_rollback_returns_the_preview(app, make_user):
+    user_id = make_user(subscription_status='trial')
+    
+    user = db.session.get(User, user_id)
+    assert user.consume_preview()
+    assert not user.consume_preview()
+    db.session.rollback()
+    
+    db.session.expire_all()
+    user = db.session.get(User, user_id)
+    assert user.free_preview_used == 0
+    assert user.consume_preview()
+    db.session.commit()
+    assert db.session.get(User, user_id).free_preview_used == 1
@@ -0,0 +1,40 @@
+import os
+import pytest
+from flask import Flask
+from models import db, BetAnalysis
+from query_plans import check_query_plans, explain
+from conftest import reset_process_state
+
+# Other databases are checked when a URL for a scratch database is configured
+DATABASES = {
+    'sqlite': 'sqlite:///:memory:',
+    'postgresql': os.getenv('TEST_POSTGRES_URL'),
+    'mysql': os.getenv('TEST_MYSQL_URL')
+}
+
+
+@pytest.fixture(params=sorted(DATABASES))
+def plan_app(request):
+    url = DATABASES[request.param]
+    if not url:
+        pytest.skip(f'set TEST_{request.param.upper()}_URL to check {request.param} plans')
+    
+    reset_process_state()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_hot_queries_use_indexes(plan_app):
+    assert check_query_plans() == []
+
+
+def test_full_scans_are_reported(plan_app):
+    # A filter on an unindexed column has to read the whole table
+    plan, full_scans = explain(BetAnalysis.query.filter(BetAnalysis.sport == 'nba'))
+    assert full_scans == ['bet_analysis'], plan
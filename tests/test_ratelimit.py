@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+import pytest
+import ratelimit
+from models import TIER_PAID, TIER_PREVIEW
+from ratelimit import MemoryBackend, SlidingWindowRateLimiter
+from conftest import login
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'time', lambda: now[0])
+    return now
+
+
+def limiter(limits):
+    return SlidingWindowRateLimiter(MemoryBackend(), limits)
+
+
+def test_limits_are_per_tier(clock):
+    limits = limiter({TIER_PAID: [(60, 3)], TIER_PREVIEW: [(60, 1)]})
+    
+    assert [limits.hit('paid', TIER_PAID).allowed for _ in range(4)] == [True, True, True, False]
+    assert [limits.hit('preview', TIER_PREVIEW).allowed for _ in range(2)] == [True, False]
+    assert limits.hit('other', 'unlimited').allowed
+
+
+def test_denied_requests_use_no_quota(clock):
+    limits = limiter({TIER_PAID: [(60, 2), (3600, 3)]})
+    assert limits.hit('u', TIER_PAID) and limits.hit('u', TIER_PAID)
+    
+    clock[0] += 1
+    denied = limits.hit('u', TIER_PAID)
+    assert (denied.allowed, denied.retry_after) == (False, 59)
+    
+    # Had the denied request been logged, the hourly window would be full
+    clock[0] += 60
+    assert limits.hit('u', TIER_PAID).allowed
+    
+    clock[0] += 1
+    denied = limits.hit('u', TIER_PAID)
+    assert (denied.allowed, denied.retry_after) == (False, 3600 - 62)
+
+
+def test_zero_limit_blocks(clock):
+    limits = limiter({TIER_PREVIEW: [(60, 5), (3600, 0)]})
+    
+    denied = limits.hit('u', TIER_PREVIEW)
+    assert (denied.allowed, denied.retry_after) == (False, 3600)
+
+
+@pytest.mark.parametrize('path, body', [
+    ('/api/analyze/all-bets', None),
+    ('/api/analyze/specific-bet', {'sport': 'nba', 'game': 'A vs B', 'bet_legs': ['A ML']})
+])
+def test_analyze_routes_return_429(web_app, make_user, path, body):
+    web_app.config['API_CALLS_PER_MINUTE'] = 1
+    with web_app.app_context():
+        user_id = make_user(
+            subscription_status='active',
+            subscription_end_date=datetime.utcnow() + timedelta(days=30)
+        )
+    client = login(web_app.test_client(), user_id)
+    
+    assert client.post(path, json=body).status_code == 202
+    response = client.post(path, json=body)
+    assert response.status_code == 429
+    assert 0 < int(response.headers['Retry-After']) <= 60
+    assert response.json['retry_after'] == int(response.headers['Retry-After'])
@@ -0,0 +1,120 @@
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pytest
+import stripe
+import reconcile
+from models import db, User
+
+PERIOD_END = 1900000000
+
+
+def subscription(id, customer, status, period_end=PERIOD_END, items=False):
+    data = {'id': id, 'object': 'subscription', 'customer': customer, 'status': status}
+    if items:
+        # Newer API versions only report the period on subscription items
+        data['items'] = {'object': 'list', 'data': [{'current_period_end': period_end}]}
+    else:
+        data['current_period_end'] = period_end
+    return data
+
+
+# Newest first, as Stripe lists them
+SUBSCRIPTIONS = [
+    subscription('sub_b2', 'cus_b', 'active', PERIOD_END + 2, items=True),
+    subscription('sub_f1', 'cus_f', 'active'),
+    subscription('sub_a1', 'cus_a', 'canceled', PERIOD_END + 1),
+    subscription('sub_d1', 'cus_d', 'incomplete'),
+    subscription('sub_f2', 'cus_f2', 'active'),
+    subscription('sub_b1', 'cus_b', 'canceled'),
+    subscription('sub_c1', 'cus_c', 'active')
+]
+
+
+@pytest.fixture
+def stripe_list(app, monkeypatch):
+    """Fake Stripe subscriptions list endpoint; returns the requested query strings"""
+    requests = []
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            requests.append(query)
+            ids = [item['id'] for item in SUBSCRIPTIONS]
+            start = ids.index(query['starting_after'][0]) + 1 if 'starting_after' in query else 0
+            limit = int(query['limit'][0])
+            body = json.dumps({
+                'object': 'list',
+                'url': '/v1/subscriptions',
+                'has_more': start + limit < len(SUBSCRIPTIONS),
+                'data': SUBSCRIPTIONS[start:start + limit]
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(stripe, 'api_base', stripe.api_base)
+    monkeypatch.setattr(stripe, 'api_key', stripe.api_key)
+    monkeypatch.setitem(app.config, 'STRIPE_API_BASE', f'http://127.0.0.1:{server.server_port}')
+    monkeypatch.setitem(app.config, 'STRIPE_SECRET_KEY', 'sk_test_reconcile')
+    yield requests
+    server.shutdown()
+    server.server_close()
+
+
+def user_rows():
+    return {
+        user.username: (user.stripe_subscription_id, user.subscription_status, user.subscription_end_date)
+        for user in User.query.order_by(User.username)
+    }
+
+
+def test_reconcile_subscriptions(app, make_user, stripe_list, monkeypatch):
+    end = datetime.utcfromtimestamp(PERIOD_END)
+    make_user(username='a', stripe_customer_id='cus_a', stripe_subscription_id='sub_a1', subscription_status='active')
+    make_user(username='b', stripe_customer_id='cus_b', subscription_status='trial')
+    make_user(username='c', stripe_customer_id='cus_c', stripe_subscription_id='sub_c1',
+              subscription_status='active', subscription_end_date=end)
+    make_user(username='d', stripe_customer_id='cus_d', subscription_status='trial')
+    
+    chunks = []
+    reconcile_chunk = reconcile.reconcile_chunk
+    
+    def record_chunk(subscriptions):
+        chunks.append([item['id'] for item in subscriptions])
+        return reconcile_chunk(subscriptions)
+    
+    monkeypatch.setattr(reconcile, 'reconcile_chunk', record_chunk)
+    
+    totals = reconcile.reconcile_subscriptions(chunk_size=3, page_size=2)
+    assert totals == {'subscriptions': 7, 'matched': 3, 'updated': 2}
+    assert chunks == [['sub_b2', 'sub_f1', 'sub_a1'], ['sub_d1', 'sub_f2', 'sub_b1'], ['sub_c1']]
+    assert [query.get('starting_after') for query in stripe_list] == [
+        None, ['sub_f1'], ['sub_d1'], ['sub_b1']
+    ]
+    
+    db.session.expire_all()
+    rows = user_rows()
+    assert rows == {
+        'a': ('sub_a1', 'cancelled', datetime.utcfromtimestamp(PERIOD_END + 1)),
+        # No stored id: the customer's newest subscription, period from its items
+        'b': ('sub_b2', 'active', datetime.utcfromtimestamp(PERIOD_END + 2)),
+        'c': ('sub_c1', 'active', end),
+        # Incomplete subscriptions are left alone
+        'd': (None, 'trial', None)
+    }
+    
+    totals = reconcile.reconcile_subscriptions(chunk_size=3, page_size=2)
+    assert totals == {'subscriptions': 7, 'matched': 3, 'updated': 0}
+    db.session.expire_all()
+    assert user_rows() == rows
@@ -0,0 +1,71 @@
+import threading
+import pytest
+from sqlalchemy.exc import IntegrityError
+import passwords
+from models import User, violated_unique_columns
+
+
+def register(client, username, email):
+    return client.post('/register', json={
+        'username': username,
+        'email': email,
+        'password': 'password1',
+        'confirm_password': 'password1'
+    })
+
+
+def test_duplicates_map_to_the_violated_field(web_app):
+    client = web_app.test_client()
+    assert register(client, 'alice', 'alice@example.com').status_code == 302
+    
+    response = register(web_app.test_client(), 'alice', 'other@example.com')
+    assert (response.status_code, response.json['error']) == (409, 'Username already exists')
+    
+    response = register(web_app.test_client(), 'bob', 'alice@example.com')
+    assert (response.status_code, response.json['error']) == (409, 'Email already registered')
+
+
+def test_other_integrity_errors_are_server_errors(web_app, monkeypatch):
+    # A NOT NULL violation must not be reported as a taken username
+    monkeypatch.setattr(passwords.PasswordService, 'hash', lambda self, password: None)
+    response = register(web_app.test_client(), 'alice', 'alice@example.com')
+    assert (response.status_code, response.json['error']) == (500, 'Registration failed')
+
+
+def test_concurrent_signups_for_one_username(web_app):
+    statuses = []
+    
+    def signup(n):
+        statuses.append(register(web_app.test_client(), 'race', f'race{n}@example.com').status_code)
+    
+    threads = [threading.Thread(target=signup, args=(n,)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(statuses) == [302, 409, 409, 409, 409, 409]
+
+
+class Diagnostics:
+    def __init__(self, constraint_name):
+        self.constraint_name = constraint_name
+
+
+class DriverError(Exception):
+    def __init__(self, message, constraint_name=None):
+        super().__init__(message)
+        if constraint_name:
+            self.diag = Diagnostics(constraint_name)
+
+
+@pytest.mark.parametrize('orig, expected', [
+    (DriverError('UNIQUE constraint failed: users.email'), ('email',)),
+    (DriverError('NOT NULL constraint failed: users.password_hash'), None),
+    (DriverError('duplicate key value violates unique constraint', 'ix_users_username'), ('username',)),
+    (DriverError('duplicate key value violates unique constraint', 'users_stripe_customer_id_key'), ('stripe_customer_id',)),
+    (DriverError('null value in column "password_hash" violates not-null constraint', None), None),
+    (DriverError("(1062, \"Duplicate entry 'a@b' for key 'users.ix_users_email'\")"), ('email',)),
+])
+def test_violated_unique_columns(orig, expected):
+    error = IntegrityError('INSERT INTO users ...', {}, orig)
+    assert violated_unique_columns(error, User.__table__) == expected
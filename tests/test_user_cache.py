@@ -0,0 +1,49 @@
+import json
+from flask import g
+from sqlalchemy import update
+import user_cache
+from cache import get_redis
+from models import db, User
+from user_cache import get_user, user_cache_key, TOMBSTONE
+
+
+def fresh_request():
+    g.pop('user_identity_map', None)
+    db.session.expire_all()
+
+
+def test_fill_racing_an_update_does_not_cache_stale_data(app, make_user, monkeypatch):
+    user_id = make_user(free_preview_used=0)
+    serialize_user = user_cache.serialize_user
+    
+    def serialize_then_update(user):
+        # Another process commits a change after this fill read the database
+        data = serialize_user(user)
+        with db.engine.begin() as connection:
+            connection.execute(update(User).where(User.id == user_id).values(free_preview_used=1))
+        user_cache.invalidate_user(user_id)
+        return data
+    
+    monkeypatch.setattr(user_cache, 'serialize_user', serialize_then_update)
+    assert get_user(user_id).free_preview_used == 0
+    assert get_redis().get(user_cache_key(user_id)) == TOMBSTONE
+    
+    monkeypatch.setattr(user_cache, 'serialize_user', serialize_user)
+    fresh_request()
+    assert get_user(user_id).free_preview_used == 1
+
+
+def test_commit_replaces_cached_user_with_tombstone(app, make_user):
+    user_id = make_user()
+    # Creating the user left a tombstone; let it expire
+    get_redis().delete(user_cache_key(user_id))
+    get_user(user_id)
+    assert json.loads(get_redis().get(user_cache_key(user_id)))['free_preview_used'] == 0
+    
+    fresh_request()
+    get_user(user_id).free_preview_used = 2
+    db.session.commit()
+    assert get_redis().get(user_cache_key(user_id)) == TOMBSTONE
+    
+    fresh_request()
+    assert get_user(user_id).free_preview_used == 2
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+import auth
+from sqlalchemy import event
+from auth import enqueue_webhook_event, process_webhook_events, requeue_webhook_events
+from models import db, User, StripeEvent
+
+PERIOD_END = 1893456000  # 2030-01-01
+
+
+def subscription_event(event_id, **subscription):
+    subscription.setdefault('object', 'subscription')
+    subscription.setdefault('id', 'sub_1')
+    subscription.setdefault('customer', 'cus_1')
+    return {'id': event_id, 'type': 'customer.subscription.updated', 'data': {'object': subscription}}
+
+
+def make_due(stripe_event_id):
+    event = StripeEvent.query.filter_by(stripe_event_id=stripe_event_id).one()
+    event.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_period_end_read_from_subscription_items(app, make_user):
+    user_id = make_user(stripe_customer_id='cus_1')
+    enqueue_webhook_event(subscription_event(
+        'evt_1',
+        items={'data': [{'current_period_end': PERIOD_END}]}
+    ))
+    
+    assert process_webhook_events() == 1
+    user = db.session.get(User, user_id)
+    assert user.subscription_status == 'active'
+    assert user.subscription_end_date == datetime.utcfromtimestamp(PERIOD_END)
+
+
+def test_failed_events_back_off_then_park(app, make_user):
+    app.config['STRIPE_WEBHOOK_MAX_ATTEMPTS'] = 2
+    make_user(stripe_customer_id='cus_1')
+    enqueue_webhook_event(subscription_event('evt_1'))  # no period end anywhere
+    
+    assert process_webhook_events() == 1
+    event = StripeEvent.query.one()
+    assert (event.processed, event.attempts) == (False, 1)
+    assert event.next_attempt_at > datetime.utcnow()
+    assert process_webhook_events() == 0  # not due yet
+    
+    make_due('evt_1')
+    assert process_webhook_events() == 1
+    event = StripeEvent.query.one()
+    assert (event.attempts, event.next_attempt_at) == (2, None)
+    assert 'current_period_end' in event.error_message
+    assert process_webhook_events() == 0  # parked
+
+
+def test_requeued_events_are_processed(app, make_user):
+    app.config['STRIPE_WEBHOOK_MAX_ATTEMPTS'] = 1
+    user_id = make_user(stripe_customer_id='cus_1')
+    enqueue_webhook_event(subscription_event('evt_1'))
+    process_webhook_events()
+    
+    # The event data is fixed (e.g. after a Stripe API version change) and requeued
+    event = StripeEvent.query.one()
+    event.event_data = {**event.event_data, 'current_period_end': PERIOD_END}
+    db.session.commit()
+    
+    assert requeue_webhook_events() == 1
+    assert process_webhook_events() == 1
+    assert StripeEvent.query.one().processed
+    assert db.session.get(User, user_id).subscription_end_date == datetime.utcfromtimestamp(PERIOD_END)
+
+
+def test_duplicate_delivery_inserts_nothing(app):
+    enqueue_webhook_event(subscription_event('evt_1'))
+    
+    statements = []
+    
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        # Redelivered to this process, then to another (no LRU entry)
+        enqueue_webhook_event(subscription_event('evt_1'))
+        auth._queued_events.clear()
+        enqueue_webhook_event(subscription_event('evt_1'))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    
+    assert len(statements) == 1  # the second process's conflicting insert
+    assert StripeEvent.query.filter_by(stripe_event_id='evt_1').count() == 1
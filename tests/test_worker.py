@@ -0,0 +1,111 @@
+import gc
+from datetime import datetime
+import pytest
+import ollama_client
+import sportsbook
+from models import db, BetAnalysis, PRIORITY_PAID, PRIORITY_PREVIEW
+from worker import claim_analyses, process_analysis
+
+QUEUED_AT = datetime.utcnow().replace(microsecond=0)
+
+PAYLOAD = {'advantages': [
+    {
+        'market': {'type': 'ML', 'event': {'name': 'A vs B'}},
+        'outcomes': [
+            {'type': 'HOME', 'source': 'FD', 'payout': 2.3},
+            {'type': 'AWAY', 'source': 'FD', 'payout': 1.8}
+        ]
+    },
+    {
+        'market': {'type': 'ML', 'event': {'name': 'A vs B'}},
+        'outcomes': [
+            {'type': 'HOME', 'source': 'DK', 'payout': 1.95},
+            {'type': 'AWAY', 'source': 'DK', 'payout': 1.95}
+        ]
+    }
+]}
+
+
+@pytest.fixture
+def backends(app, monkeypatch):
+    """Serve PAYLOAD from the sportsbook and stream a canned Ollama response"""
+    calls = {'sportsbook': 0, 'ollama': 0}
+    
+    def get_advantages(self, params=None):
+        calls['sportsbook'] += 1
+        return PAYLOAD
+    
+    def stream(self, prompt):
+        calls['ollama'] += 1
+        # Drop unreferenced instances so commits expire already-collected states
+        gc.collect()
+        yield 'Back '
+        yield 'the home side.'
+    
+    monkeypatch.setattr(sportsbook.SportsbookClient, 'get_advantages', get_advantages)
+    monkeypatch.setattr(ollama_client.OllamaClient, 'stream', stream)
+    app.config['OLLAMA_FLUSH_INTERVAL'] = 0
+    return calls
+
+
+def queue_analysis(user_id, **values):
+    # One fixed timestamp, so analyses queued by a test always share a
+    # snapshot window however the inserts fall around a window boundary
+    values.setdefault('created_at', QUEUED_AT)
+    analysis = BetAnalysis(user_id=user_id, status='processing', **values)
+    db.session.add(analysis)
+    db.session.commit()
+    return analysis.id
+
+
+@pytest.mark.parametrize('subscription', ['trial', 'active'])
+def test_specific_bet_completes(app, backends, make_user, subscription):
+    user_id = make_user(subscription_status=subscription)
+    analysis_id = queue_analysis(
+        user_id,
+        analysis_type='specific_bet',
+        sport='nba',
+        game='A vs B',
+        bet_legs=['A ML']
+    )
+    db.session.remove()
+    
+    assert claim_analyses('worker-1', 10, 600) == [analysis_id]
+    db.session.remove()
+    process_analysis(analysis_id, 'worker-1')
+    db.session.remove()
+    
+    analysis = db.session.get(BetAnalysis, analysis_id)
+    assert analysis.status == 'completed', analysis.error_message
+    assert analysis.ollama_analysis == 'Back the home side.'
+    assert analysis.recommendations
+    assert analysis.get_api_response() == PAYLOAD
+    assert backends == {'sportsbook': 1, 'ollama': 1}
+
+
+def test_all_bets_share_one_snapshot(app, backends, make_user):
+    user_id = make_user()
+    analysis_ids = [queue_analysis(user_id, analysis_type='all_bets') for _ in range(3)]
+    db.session.remove()
+    
+    claimed = claim_analyses('worker-1', 10, 600)
+    assert sorted(claimed) == sorted(analysis_ids)
+    for analysis_id in claimed:
+        db.session.remove()
+        process_analysis(analysis_id, 'worker-1')
+    db.session.remove()
+    
+    analyses = BetAnalysis.query.all()
+    assert {analysis.status for analysis in analyses} == {'completed'}
+    assert len({analysis.snapshot_id for analysis in analyses}) == 1
+    assert analyses[0].result.ollama_analysis == 'Back the home side.'
+    assert backends['ollama'] == 1
+
+
+def test_paid_analyses_are_claimed_first(app, make_user):
+    user_id = make_user()
+    preview_id = queue_analysis(user_id, analysis_type='all_bets', priority=PRIORITY_PREVIEW)
+    paid_id = queue_analysis(user_id, analysis_type='all_bets', priority=PRIORITY_PAID)
+    
+    assert claim_analyses('worker-1', 1, 600) == [paid_id]
+    assert claim_analyses('worker-2', 1, 600) == [preview_id]
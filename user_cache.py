@@ -0,0 +1,130 @@
+from flask import current_app, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+from models import db, User
+from cache import get_redis
+import logging
+import json
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Never copied into the shared cache; loaded from the database on access
+EXCLUDED_COLUMNS = ('password_hash',)
+
+# Left in place of an invalidated entry so a fill that read the database
+# before the invalidating commit cannot write its stale copy back
+TOMBSTONE = 'invalidated'
+
+
+def user_cache_key(user_id):
+    return f'wagerwise:users:{user_id}'
+
+
+def serialize_user(user):
+    """Column values of a user as JSON-safe data"""
+    data = {}
+    for column in User.__table__.columns:
+        if column.key in EXCLUDED_COLUMNS:
+            continue
+        value = getattr(user, column.key)
+        data[column.key] = value.isoformat() if isinstance(value, datetime) else value
+    return data
+
+
+def deserialize_user(data):
+    """Attach a cached user to the session without querying the database"""
+    values = {}
+    for column in User.__table__.columns:
+        if column.key not in data:
+            continue
+        value = data[column.key]
+        if value is not None and isinstance(column.type, db.DateTime):
+            value = datetime.fromisoformat(value)
+        values[column.key] = value
+    
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def get_user(user_id):
+    """
+    Return a user by id, checking the request and shared caches first
+    
+    Within a request each user is resolved once (identity map in g). Across
+    requests the user's columns are shared through Redis for
+    CACHE_TTL_USER_DATA seconds, so most requests load their user without a
+    database round-trip. Cached entries are replaced by a short-lived
+    tombstone whenever a transaction that touched the user commits; fills
+    only write with SET NX, so they never overwrite a tombstone.
+    """
+    identity_map = g.setdefault('user_identity_map', {})
+    user = identity_map.get(user_id)
+    if user is not None:
+        return user
+    
+    redis = get_redis()
+    raw = None
+    try:
+        raw = redis.get(user_cache_key(user_id))
+    except Exception as e:
+        logger.warning(f'User cache read failed: {str(e)}')
+    
+    if raw is not None and raw != TOMBSTONE:
+        user = deserialize_user(json.loads(raw))
+    else:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        try:
+            redis.set(
+                user_cache_key(user_id),
+                json.dumps(serialize_user(user)),
+                ex=current_app.config['CACHE_TTL_USER_DATA'],
+                nx=True
+            )
+        except Exception as e:
+            logger.warning(f'User cache write failed: {str(e)}')
+    
+    identity_map[user_id] = user
+    return user
+
+
+def invalidate_user(user_id):
+    """Replace a user's shared cache entry with a tombstone so requests reload it"""
+    try:
+        get_redis().set(
+            user_cache_key(user_id),
+            TOMBSTONE,
+            ex=current_app.config['CACHE_USER_TOMBSTONE_TTL']
+        )
+    except Exception as e:
+        logger.warning(f'User cache invalidation failed for {user_id}: {str(e)}')
+
+
+def mark_user_changed(session, user_id):
+    """Invalidate a user when the session's transaction commits"""
+    session.info.setdefault('changed_user_ids', set()).add(user_id)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_changed_users(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, User) and instance.id:
+            mark_user_changed(session, instance.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    # Fires for StripeManager updates, registration, preview usage and any
+    # other commit that modified a user
+    changed = session.info.pop('changed_user_ids', None)
+    if changed and has_app_context():
+        for user_id in changed:
+            invalidate_user(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
@@ -0,0 +1,239 @@
+from flask import Flask
+from flask_migrate import Migrate
+from sqlalchemy import or_, update
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import config
+from models import db, BetAnalysis, SKIP_LOCKED_DIALECTS
+from analysis import AnalysisRunner
+from snapshots import SHARED_ANALYSIS_TYPES, process_shared_analysis
+from events import publish_status
+from auth import process_webhook_events
+from ollama_client import get_scheduler
+from commands import register_commands
+import multiprocessing
+import threading
+import logging
+import signal
+import socket
+import json
+import time
+import os
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+def create_worker_app(config_name=None):
+    """Minimal application for worker processes and CLI commands (no routes or login)"""
+    
+    if config_name is None:
+        config_name = os.getenv('FLASK_ENV', 'development')
+    
+    app = Flask(__name__)
+    app.config.from_object(config[config_name])
+    db.init_app(app)
+    Migrate(app, db, render_as_batch=True)
+    register_commands(app)  # flask --app worker:create_worker_app <command>
+    
+    logging.basicConfig(
+        level=app.config['LOG_LEVEL'],
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    with app.app_context():
+        db.create_all()
+    
+    return app
+
+
+def claim_analyses(worker_id, limit, claim_timeout):
+    """Claim up to `limit` queued analyses (paid first, then oldest) and return their ids"""
+    now = datetime.utcnow()
+    claimable = (
+        BetAnalysis.status == 'processing',
+        or_(
+            BetAnalysis.claimed_at.is_(None),
+            BetAnalysis.claimed_at < now - timedelta(seconds=claim_timeout)
+        )
+    )
+    query = BetAnalysis.query.filter(*claimable).order_by(
+        BetAnalysis.priority,
+        BetAnalysis.created_at
+    ).limit(limit)
+    
+    if db.engine.dialect.name in SKIP_LOCKED_DIALECTS:
+        analyses = query.with_for_update(skip_locked=True).all()
+        for analysis in analyses:
+            analysis.claimed_by = worker_id
+            analysis.claimed_at = now
+        db.session.commit()
+        return [analysis.id for analysis in analyses]
+    
+    # SQLite fallback: no row locks, so claim each candidate with a
+    # conditional UPDATE and keep only the rows this worker won.
+    candidate_ids = [analysis_id for (analysis_id,) in query.with_entities(BetAnalysis.id)]
+    claimed = []
+    for analysis_id in candidate_ids:
+        result = db.session.execute(
+            update(BetAnalysis)
+            .where(BetAnalysis.id == analysis_id, *claimable)
+            .values(claimed_by=worker_id, claimed_at=now)
+        )
+        if result.rowcount == 1:
+            claimed.append(analysis_id)
+    db.session.commit()
+    return claimed
+
+
+def process_analysis(analysis_id, worker_id):
+    """Run a claimed analysis and store its results"""
+    analysis = db.session.get(BetAnalysis, analysis_id)
+    if analysis is None or analysis.status != 'processing' or analysis.claimed_by != worker_id:
+        logger.info(f'Analysis {analysis_id} no longer claimed by {worker_id}, skipping')
+        return
+    
+    if analysis.analysis_type in SHARED_ANALYSIS_TYPES:
+        process_shared_analysis(analysis)
+        return
+    
+    started = time.monotonic()
+    try:
+        AnalysisRunner().run(analysis)
+        analysis.status = 'completed'
+        analysis.error_message = None
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f'Analysis {analysis_id} failed: {str(e)}')
+        analysis = db.session.get(BetAnalysis, analysis_id)
+        analysis.status = 'failed'
+        analysis.error_message = str(e)
+    
+    analysis.processing_time = time.monotonic() - started
+    analysis.completed_at = datetime.utcnow()
+    db.session.commit()
+    publish_status([analysis_id], analysis.status)
+    logger.info(f'Analysis {analysis_id} {analysis.status} in {analysis.processing_time:.2f}s')
+
+
+class AnalysisWorker:
+    """Polls for queued analyses and runs them on a thread pool; also drains Stripe webhooks"""
+    
+    def __init__(self, app):
+        self.app = app
+        self.threads = app.config['ANALYSIS_WORKER_THREADS']
+        self.poll_interval = app.config['ANALYSIS_WORKER_POLL_INTERVAL']
+        self.claim_timeout = app.config['ANALYSIS_CLAIM_TIMEOUT']
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.webhook_batch_size = app.config['STRIPE_WEBHOOK_BATCH_SIZE']
+        self.next_webhook_poll = 0
+        self.stats_interval = app.config['OLLAMA_STATS_INTERVAL']
+        self.next_stats_log = time.monotonic() + self.stats_interval
+        self.stopping = threading.Event()
+    
+    def stop(self, *args):
+        """Stop claiming new work; in-flight analyses are allowed to finish"""
+        self.stopping.set()
+    
+    def run(self):
+        """Claim and process analyses until stopped"""
+        logger.info(f'Analysis worker {self.worker_id} started with {self.threads} threads')
+        in_flight = set()
+        
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            while not self.stopping.is_set():
+                if time.monotonic() >= self.next_webhook_poll:
+                    self._process_webhooks()
+                if time.monotonic() >= self.next_stats_log:
+                    self._log_stats()
+                
+                in_flight = {future for future in in_flight if not future.done()}
+                claimed = []
+                
+                if len(in_flight) < self.threads:
+                    try:
+                        with self.app.app_context():
+                            claimed = claim_analyses(
+                                self.worker_id,
+                                self.threads - len(in_flight),
+                                self.claim_timeout
+                            )
+                    except Exception as e:
+                        logger.error(f'Error claiming analyses: {str(e)}')
+                
+                for analysis_id in claimed:
+                    in_flight.add(executor.submit(self._process, analysis_id))
+                
+                if claimed:
+                    continue
+                if in_flight:
+                    wait(in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    self.stopping.wait(self.poll_interval)
+        
+        logger.info(f'Analysis worker {self.worker_id} stopped')
+    
+    def _process_webhooks(self):
+        """Drain queued Stripe events in batches, then wait a poll interval"""
+        with self.app.app_context():
+            try:
+                while process_webhook_events(self.webhook_batch_size) == self.webhook_batch_size:
+                    if self.stopping.is_set():
+                        break
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f'Error processing webhook events: {str(e)}')
+        self.next_webhook_poll = time.monotonic() + self.poll_interval
+    
+    def _log_stats(self):
+        """Log the Ollama scheduler's queue depth and per-priority wait times"""
+        with self.app.app_context():
+            stats = get_scheduler().stats()
+        logger.info(f'Ollama scheduler stats: {json.dumps(stats)}')
+        self.next_stats_log = time.monotonic() + self.stats_interval
+    
+    def _process(self, analysis_id):
+        with self.app.app_context():
+            try:
+                process_analysis(analysis_id, self.worker_id)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f'Error processing analysis {analysis_id}: {str(e)}')
+
+
+def run_worker(config_name=None):
+    """Run a single worker in the current process"""
+    worker = AnalysisWorker(create_worker_app(config_name))
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+def run_worker_pool(config_name=None, processes=None):
+    """Run `processes` workers; add processes (or hosts) to scale throughput"""
+    if processes is None:
+        processes = config[config_name or os.getenv('FLASK_ENV', 'development')].ANALYSIS_WORKER_PROCESSES
+    
+    if processes <= 1:
+        run_worker(config_name)
+        return
+    
+    children = [
+        multiprocessing.Process(target=run_worker, args=(config_name,))
+        for _ in range(processes)
+    ]
+    for child in children:
+        child.start()
+    
+    def shutdown(*args):
+        for child in children:
+            child.terminate()
+    
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    
+    for child in children:
+        child.join()
+
+
+if __name__ == '__main__':
+    run_worker_pool()